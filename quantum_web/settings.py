@@ -156,6 +156,30 @@ RESULT_QUEUE_PREFIX = os.getenv("RESULT_QUEUE_PREFIX", "quantum_result")
 # result queue expire time
 RESULT_QUEUE_EXPIRE = int(os.getenv("RESULT_QUEUE_EXPIRE", str(60 * 60)))
 
+# result stream is trimmed to about this number of messages
+RESULT_STREAM_MAXLEN = int(os.getenv("RESULT_STREAM_MAXLEN", "1000"))
+
+# summary stream with downsampled result history replayed to late subscribers: maximum number
+# of messages, the first solution interval (seconds) and the growth of following intervals
+RESULT_SUMMARY_MAXLEN = int(os.getenv("RESULT_SUMMARY_MAXLEN", "100"))
+RESULT_SUMMARY_INTERVAL = float(os.getenv("RESULT_SUMMARY_INTERVAL", "0.1"))
+RESULT_SUMMARY_GROWTH = float(os.getenv("RESULT_SUMMARY_GROWTH", "1.25"))
+
+# maximum number of result messages buffered by a job while they are sent to redis,
+# the oldest solution is dropped when the buffer is full
+RESULT_PUBLISH_BUFFER = int(os.getenv("RESULT_PUBLISH_BUFFER", "256"))
+# maximum time a finished job waits for its buffered messages and STOP to be sent (seconds)
+RESULT_PUBLISH_TIMEOUT = float(os.getenv("RESULT_PUBLISH_TIMEOUT", "30"))
+
+# job cancellation key and channel prefix
+CANCEL_PREFIX = os.getenv("CANCEL_PREFIX", "quantum_cancel")
+
+# cancel the job when the last websocket client streaming it disconnects
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "1") == "1"
+
+# seconds to wait for a client to reconnect (e.g. page reload) before cancelling the job
+CANCEL_ON_DISCONNECT_DELAY = float(os.getenv("CANCEL_ON_DISCONNECT_DELAY", "5"))
+
 # number of tries when awaiting job stream
 STREAM_WAIT_MAX_TRIES = int(os.getenv("STREAM_WAIT_MAX_TRIES", "60"))
 
@@ -165,6 +189,44 @@ STREAM_WAIT_SLEEP_INTERVAL = int(os.getenv("STREAM_WAIT_SLEEP_INTERVAL", "5"))
 # maximum number of concurrent jobs running on a single worker instance
 WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", "2"))
 
+# adapt the number of concurrent jobs between WORKER_MIN_CONCURRENCY and WORKER_MAX_CONCURRENCY
+# to the queue length, CPU utilisation of jobs and memory headroom
+WORKER_ADAPTIVE_CONCURRENCY = os.getenv("WORKER_ADAPTIVE_CONCURRENCY", "0") == "1"
+WORKER_MIN_CONCURRENCY = int(os.getenv("WORKER_MIN_CONCURRENCY", "1"))
+
+# interval between adaptive concurrency decisions (seconds)
+WORKER_SCALE_INTERVAL = float(os.getenv("WORKER_SCALE_INTERVAL", "5"))
+
+# adaptive concurrency grows while jobs use less than this fraction of host CPUs, and shrinks
+# while a job gets less than WORKER_SCALE_CPU_LOW of a CPU
+WORKER_SCALE_CPU_TARGET = float(os.getenv("WORKER_SCALE_CPU_TARGET", "0.9"))
+WORKER_SCALE_CPU_LOW = float(os.getenv("WORKER_SCALE_CPU_LOW", "0.5"))
+
+# memory kept free by adaptive concurrency (bytes)
+WORKER_MIN_FREE_MEMORY = int(os.getenv("WORKER_MIN_FREE_MEMORY", str(256 * 2 ** 20)))
+
+# seconds a worker waits for a free slot or a new job before doing its housekeeping
+WORKER_POLL_TIMEOUT = int(os.getenv("WORKER_POLL_TIMEOUT", "1"))
+
+# jobs of a worker which didn't refresh its liveness key for this many seconds are requeued
+WORKER_LIVENESS_TTL = int(os.getenv("WORKER_LIVENESS_TTL", "30"))
+
+# interval between sweeps requeueing jobs of dead workers (seconds)
+WORKER_RECOVERY_INTERVAL = int(os.getenv("WORKER_RECOVERY_INTERVAL", "10"))
+
+# running job refreshes its heartbeat every interval seconds, a job whose heartbeat is older
+# than ttl seconds is considered hung or dead and reaped by workers, the heartbeat isn't
+# refreshed once the solver reported no progress for ttl seconds
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "2"))
+JOB_HEARTBEAT_TTL = int(os.getenv("JOB_HEARTBEAT_TTL", "10"))
+
+# reaped job is requeued this many times before it is stopped with an error
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "0"))
+
+# minimal interval between solutions published by a job (seconds), improvements found
+# meanwhile are coalesced into the best one; 0 publishes every improvement
+WORKER_CALLBACK_INTERVAL = float(os.getenv("WORKER_CALLBACK_INTERVAL", "0.2"))
+
 QUANTUM_LOG_LEVEL = os.getenv("QUANTUM_LOG_LEVEL", "INFO")
 
 LOGGING = {
@@ -23,4 +23,5 @@ from quantum_web.webapp import views
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/start", views.start, name="start"),
+    path("api/cancel/<str:job_id>", views.cancel, name="cancel"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
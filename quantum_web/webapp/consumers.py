@@ -3,12 +3,26 @@ import logging
 
 from channels.exceptions import StopConsumer
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django_async_redis.client import DefaultClient
 
+from .jobs import add_client, cancel_abandoned_job, remove_client
 from .listener.listener import StreamUnavailable, listener
 
 log = logging.getLogger(__name__)
 
+#: pending cancellations of abandoned jobs, referenced until done
+abandoned_jobs: set[asyncio.Task] = set()
+
+
+async def cancel_abandoned(job_id: str):
+    """Cancel the job unless a client reconnects in `CANCEL_ON_DISCONNECT_DELAY` seconds."""
+    try:
+        if await cancel_abandoned_job(job_id, settings.CANCEL_ON_DISCONNECT_DELAY):
+            log.info("Job %s cancelled, no client reconnected", job_id)
+    except Exception:  # noqa
+        log.exception("Failed to cancel abandoned job %s", job_id)
+
 
 class SteamingRequestConsumer(AsyncJsonWebsocketConsumer):
     """Streaming request consumer.
@@ -29,14 +43,30 @@ class SteamingRequestConsumer(AsyncJsonWebsocketConsumer):
         Start streaming job on connection.
         """
         await super().websocket_connect(event)
+        if settings.CANCEL_ON_DISCONNECT:
+            await add_client(self.scope['url_route']['kwargs']['job_id'])
         loop = asyncio.get_event_loop()
         self.task = loop.create_task(self.streaming_job())
 
     async def websocket_disconnect(self, event):
-        """Handle websocket disconnection."""
+        """Handle websocket disconnection.
+
+        Cancel the job if it is still running and no client streams it anymore, clients
+        are counted in redis over all webapp processes (see `CANCEL_ON_DISCONNECT` setting).
+        The job is cancelled in background after a delay, the consumer stops right away.
+        """
         log.debug("Client disconnected, stopping consumer")
-        if not self.task.done():
+        running = self.task is not None and not self.task.done()
+        if running:
             self.task.cancel()
+        if settings.CANCEL_ON_DISCONNECT:
+            job_id = self.scope['url_route']['kwargs']['job_id']
+            remaining = await remove_client(job_id)
+            if running and remaining <= 0:
+                log.info("Last client of job %s disconnected", job_id)
+                task = asyncio.create_task(cancel_abandoned(job_id))
+                abandoned_jobs.add(task)
+                task.add_done_callback(abandoned_jobs.discard)
         raise StopConsumer()
 
     async def streaming_job(self):
@@ -0,0 +1,56 @@
+import asyncio
+from typing import cast
+
+from django.conf import settings
+from django.core.cache import cache
+from django_async_redis.cache import RedisCache
+
+
+async def get_redis():
+    """Get raw redis client of the default (async redis) cache."""
+    return await cast(RedisCache, cache).client.get_client()
+
+
+def get_cancel_key(job_id: str) -> str:
+    """Get cancellation key and channel name for job id."""
+    return f"{settings.CANCEL_PREFIX}_{job_id}"
+
+
+async def cancel_job(job_id: str, reason: str = ""):
+    """Request job cancellation.
+
+    The key lets a worker skip a job that didn't start yet, the message stops a running one.
+    """
+    key = get_cancel_key(job_id)
+    redis_client = await get_redis()
+    await redis_client.set(key, reason, ex=settings.RESULT_QUEUE_EXPIRE)
+    await redis_client.publish(key, reason)
+
+
+def get_clients_key(job_id: str) -> str:
+    """Get key counting clients streaming the job."""
+    return f"{settings.CANCEL_PREFIX}_{job_id}_clients"
+
+
+async def add_client(job_id: str):
+    """Count a new client streaming the job (clients of all webapp processes are counted)."""
+    key = get_clients_key(job_id)
+    redis_client = await get_redis()
+    await redis_client.incr(key)
+    await redis_client.expire(key, settings.RESULT_QUEUE_EXPIRE)
+
+
+async def remove_client(job_id: str) -> int:
+    """Uncount a client streaming the job and return the number of remaining clients."""
+    redis_client = await get_redis()
+    return await redis_client.decr(get_clients_key(job_id))
+
+
+async def cancel_abandoned_job(job_id: str, delay: float = settings.CANCEL_ON_DISCONNECT_DELAY):
+    """Cancel the job unless a client connects within `delay` seconds (e.g. page reload)."""
+    await asyncio.sleep(delay)
+    redis_client = await get_redis()
+    if int(await redis_client.get(get_clients_key(job_id)) or 0) > 0:
+        return False
+    await cancel_job(job_id, "All clients disconnected")
+    return True
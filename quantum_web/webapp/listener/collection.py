@@ -38,12 +38,13 @@ class SubscribersCollection:
     def __init__(self):
         self.groups = []
 
-    def add(self, stream_name: str) -> asyncio.Queue:
+    def add(self, stream_name: str, last_message_id: str = "0") -> asyncio.Queue:
         """Add new subscriber for the stream and return queue to consume messages.
 
-        Looking for a first group without listeners on specified stream.
+        Looking for a first group without listeners on specified stream. Subscriber receives
+        messages after `last_message_id`.
         """
-        instance = Subscriber()
+        instance = Subscriber(last_message_id)
         for i, group in enumerate(self.groups):
             if stream_name not in group:
                 log.debug("Add listener to the group %i", i)
@@ -34,10 +34,10 @@ class JobResultListener:
         self.queue_prefix = queue_prefix
         self.collection = SubscribersCollection()
 
-    def subscribe(self, job_id):
-        """Subscribe for a job and get queue to consume messages."""
+    def subscribe(self, job_id, last_message_id: str = "0"):
+        """Subscribe for a job and get queue to consume messages after `last_message_id`."""
         log.debug("Subscribe to %s", job_id)
-        return self.collection.add(self.get_stream_name(job_id))
+        return self.collection.add(self.get_stream_name(job_id), last_message_id)
 
     def unsubscribe(self, job_id: str, queue: asyncio.Queue):
         """Unsubscribe from the job."""
@@ -81,9 +81,20 @@ class JobResultListener:
             await asyncio.sleep(1)
 
     async def get_messages(self, job_id: str):
-        """Get results from the job stream."""
+        """Get results from the job stream.
+
+        Replay downsampled history from the summary stream first and continue with
+        the job stream from the last replayed message.
+        """
         await self.ensure_started()
-        queue = self.subscribe(job_id)
+        last_message_id = "0"
+        for msg_id, payload in await self.get_history(job_id):
+            log.debug("get_messages replay message: %s", payload)
+            yield payload
+            last_message_id = msg_id
+            if payload.get('type') == 'stop':
+                return
+        queue = self.subscribe(job_id, last_message_id)
         log.debug("get_messages subscribed to %s stream", job_id)
         try:
             while True:
@@ -133,6 +144,23 @@ class JobResultListener:
         """Get stream name for job id."""
         return f"{self.queue_prefix}_{job_id}"
 
+    def get_summary_name(self, job_id):
+        """Get summary stream name for job id."""
+        return f"{self.queue_prefix}_{job_id}_summary"
+
+    async def get_history(self, job_id: str) -> list[tuple[str, dict]]:
+        """Get downsampled job history from the summary stream.
+
+        Messages are returned with their ids in the job stream.
+        """
+        redis = await self.get_redis()
+        messages = await redis.xrange(self.get_summary_name(job_id))
+        history = []
+        for _, payload in messages:
+            payload = {k.decode(): v.decode() for k, v in payload.items()}
+            history.append((payload.pop("stream_id"), payload))
+        return history
+
     @staticmethod
     def get_redis():
         """Get raw redis client."""
@@ -3,9 +3,10 @@ from datetime import datetime
 from unittest.mock import Mock, patch
 
 from channels.testing import WebsocketCommunicator
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from quantum_web.asgi import application
+from quantum_web.webapp import consumers
 from quantum_web.webapp.listener.listener import StreamUnavailable
 
 FAKE_MESSAGES = [
@@ -25,6 +26,14 @@ async def sleep_get_messages(job_id):
 
 
 class ConsumerTest(TestCase):
+    def setUp(self) -> None:
+        patcher = patch("quantum_web.webapp.consumers.add_client")
+        self.add_client_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("quantum_web.webapp.consumers.remove_client", return_value=0)
+        self.remove_client_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch("quantum_web.webapp.consumers.listener.get_messages", new=fake_get_messages)
     @patch("quantum_web.webapp.consumers.listener.wait_job_stream")
     async def test_streaming_job(self, wait_mock: Mock):
@@ -44,16 +53,53 @@ class ConsumerTest(TestCase):
             "reason": "Worker didn't start for too long. Please try later."
         })
 
+    @patch("quantum_web.webapp.consumers.cancel_abandoned_job")
     @patch("quantum_web.webapp.consumers.listener.get_messages", new=fake_get_messages)
     @patch("quantum_web.webapp.consumers.listener.wait_job_stream")
-    async def test_client_disconnect(self, wait_mock: Mock):
+    async def test_client_disconnect(self, wait_mock: Mock, cancel_mock: Mock):
+        comm = WebsocketCommunicator(application, "/ws/process/1234/")
+        await comm.connect()
+        await comm.disconnect()
+        self.add_client_mock.assert_awaited_once_with("1234")
+        self.remove_client_mock.assert_awaited_once_with("1234")
+
+    @override_settings(CANCEL_ON_DISCONNECT_DELAY=0.5)
+    @patch("quantum_web.webapp.consumers.cancel_abandoned_job")
+    @patch("quantum_web.webapp.consumers.listener.get_messages", new=sleep_get_messages)
+    @patch("quantum_web.webapp.consumers.listener.wait_job_stream")
+    async def test_client_disconnect_on_sleep(self, wait_mock: Mock, cancel_mock: Mock):
         comm = WebsocketCommunicator(application, "/ws/process/1234/")
         await comm.connect()
         await comm.disconnect()
+        # cancelled in background, the consumer doesn't wait for the delay
+        self.assertEqual(len(consumers.abandoned_jobs), 1)
+        await asyncio.gather(*consumers.abandoned_jobs)
+        cancel_mock.assert_awaited_once_with("1234", 0.5)
+        self.assertEqual(len(consumers.abandoned_jobs), 0)
 
+    @override_settings(CANCEL_ON_DISCONNECT=False)
+    @patch("quantum_web.webapp.consumers.cancel_abandoned_job")
     @patch("quantum_web.webapp.consumers.listener.get_messages", new=sleep_get_messages)
     @patch("quantum_web.webapp.consumers.listener.wait_job_stream")
-    async def test_client_disconnect_on_sleep(self, wait_mock: Mock):
+    async def test_client_disconnect_no_cancel(self, wait_mock: Mock, cancel_mock: Mock):
         comm = WebsocketCommunicator(application, "/ws/process/1234/")
         await comm.connect()
         await comm.disconnect()
+        self.add_client_mock.assert_not_called()
+        self.remove_client_mock.assert_not_called()
+        cancel_mock.assert_not_called()
+
+    @patch("quantum_web.webapp.consumers.cancel_abandoned_job")
+    @patch("quantum_web.webapp.consumers.listener.get_messages", new=sleep_get_messages)
+    @patch("quantum_web.webapp.consumers.listener.wait_job_stream")
+    async def test_client_disconnect_other_clients(self, wait_mock: Mock, cancel_mock: Mock):
+        self.remove_client_mock.return_value = 1
+        comm = WebsocketCommunicator(application, "/ws/process/1234/")
+        await comm.connect()
+        await comm.disconnect()
+        cancel_mock.assert_not_called()
+
+    @patch("quantum_web.webapp.consumers.cancel_abandoned_job", side_effect=ConnectionError)
+    async def test_cancel_abandoned_error(self, cancel_mock: Mock):
+        with self.assertLogs("quantum_web.webapp.consumers", "ERROR"):
+            await consumers.cancel_abandoned("1234")
@@ -0,0 +1,37 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock, patch
+
+from django.conf import settings
+
+from ..jobs import add_client, cancel_abandoned_job, remove_client
+
+CLIENTS_KEY = f"{settings.CANCEL_PREFIX}_1234_clients"
+
+
+@patch("quantum_web.webapp.jobs.cache.client.get_client")
+class ClientsTest(IsolatedAsyncioTestCase):
+    async def test_add_client(self, get_client_mock: Mock):
+        redis_mock = get_client_mock.return_value = AsyncMock()
+        await add_client("1234")
+        redis_mock.incr.assert_awaited_once_with(CLIENTS_KEY)
+        redis_mock.expire.assert_awaited_once_with(CLIENTS_KEY, settings.RESULT_QUEUE_EXPIRE)
+
+    async def test_remove_client(self, get_client_mock: Mock):
+        redis_mock = get_client_mock.return_value = AsyncMock()
+        redis_mock.decr.return_value = 2
+        self.assertEqual(await remove_client("1234"), 2)
+        redis_mock.decr.assert_awaited_once_with(CLIENTS_KEY)
+
+    @patch("quantum_web.webapp.jobs.cancel_job")
+    async def test_cancel_abandoned_job(self, cancel_mock: Mock, get_client_mock: Mock):
+        redis_mock = get_client_mock.return_value = AsyncMock()
+        redis_mock.get.return_value = b"0"
+        self.assertTrue(await cancel_abandoned_job("1234", delay=0))
+        cancel_mock.assert_awaited_once_with("1234", "All clients disconnected")
+
+    @patch("quantum_web.webapp.jobs.cancel_job")
+    async def test_cancel_abandoned_job_reconnected(self, cancel_mock: Mock, get_client_mock: Mock):
+        redis_mock = get_client_mock.return_value = AsyncMock()
+        redis_mock.get.return_value = b"1"
+        self.assertFalse(await cancel_abandoned_job("1234", delay=0))
+        cancel_mock.assert_not_called()
@@ -34,9 +34,11 @@ class ListenerTest(IsolatedAsyncioTestCase):
         await self.listener.task
         listen_all_mock.assert_called_once()
 
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.get_history", return_value=[])
     @patch("quantum_web.webapp.listener.listener.JobResultListener.start")
     @patch("quantum_web.webapp.listener.listener.JobResultListener.subscribe")
-    async def test_get_messages(self, subscribe_mock: MagicMock, start_mock: MagicMock):
+    async def test_get_messages(self, subscribe_mock: MagicMock, start_mock: MagicMock,
+                                history_mock: MagicMock):
         queue: asyncio.Queue = asyncio.Queue()
         await queue.put({"type": "solution"})
         await queue.put({"type": "stop"})
@@ -46,12 +48,54 @@ class ListenerTest(IsolatedAsyncioTestCase):
             result.append(message)
         self.assertEqual(len(result), 2)
         start_mock.assert_called_once()
-        subscribe_mock.assert_called_once_with("1234")
+        subscribe_mock.assert_called_once_with("1234", "0")
 
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.get_history", return_value=[
+        ("1-1", {"type": "start"}),
+        ("1-5", {"type": "solution", "energy": "-1.5"}),
+    ])
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.start")
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.subscribe")
+    async def test_get_messages_replay(self, subscribe_mock: MagicMock, start_mock: MagicMock,
+                                       history_mock: MagicMock):
+        queue: asyncio.Queue = asyncio.Queue()
+        await queue.put({"type": "stop"})
+        subscribe_mock.return_value = queue
+        result = [message["type"] async for message in self.listener.get_messages("1234")]
+        self.assertEqual(result, ["start", "solution", "stop"])
+        subscribe_mock.assert_called_once_with("1234", "1-5")
+
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.get_history", return_value=[
+        ("1-1", {"type": "start"}),
+        ("1-9", {"type": "stop"}),
+    ])
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.start")
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.subscribe")
+    async def test_get_messages_replay_stopped(self, subscribe_mock: MagicMock,
+                                               start_mock: MagicMock, history_mock: MagicMock):
+        result = [message["type"] async for message in self.listener.get_messages("1234")]
+        self.assertEqual(result, ["start", "stop"])
+        subscribe_mock.assert_not_called()
+
+    async def test_get_history(self):
+        redis_mock = AsyncMock()
+        redis_mock.xrange = AsyncMock(return_value=[
+            (b"1-1", {b"type": b"start", b"stream_id": b"5-1"}),
+        ])
+        with patch(
+            "quantum_web.webapp.listener.listener.JobResultListener.get_redis",
+            new=AsyncMock(return_value=redis_mock)
+        ):
+            history = await self.listener.get_history("1234")
+        redis_mock.xrange.assert_called_once_with("test_1234_summary")
+        self.assertEqual(history, [("5-1", {"type": "start"})])
+
+    @patch("quantum_web.webapp.listener.listener.JobResultListener.get_history", return_value=[])
     @patch("quantum_web.webapp.listener.listener.JobResultListener.start")
     @patch("quantum_web.webapp.listener.listener.asyncio.Queue.get",
            side_effect=asyncio.CancelledError)
-    async def test_get_message_cancelled(self, get_mock: MagicMock, start_mock: MagicMock):
+    async def test_get_message_cancelled(self, get_mock: MagicMock, start_mock: MagicMock,
+                                         history_mock: MagicMock):
         gen = self.listener.get_messages("1234")
         with self.assertRaises(asyncio.CancelledError):
             await anext(gen)
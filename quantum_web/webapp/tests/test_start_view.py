@@ -1,10 +1,33 @@
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
+from django.conf import settings
 from django.test import TestCase
 
 
 class StartViewTest(TestCase):
-    @patch("quantum_web.webapp.views.cache.client.get_client")
+    @patch("quantum_web.webapp.jobs.cache.client.get_client")
     async def test_simple(self, get_client_mock: Mock):
         resp = await self.async_client.get("/api/start")
         self.assertEqual(resp.status_code, 200)
+
+
+class CancelViewTest(TestCase):
+    @patch("quantum_web.webapp.jobs.cache.client.get_client")
+    async def test_simple(self, get_client_mock: Mock):
+        redis_mock = AsyncMock()
+        get_client_mock.return_value = redis_mock
+        resp = await self.async_client.post("/api/cancel/1234")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"job_id": "1234"})
+        redis_mock.set.assert_awaited_once_with(
+            f"{settings.CANCEL_PREFIX}_1234", "Cancelled by user", ex=settings.RESULT_QUEUE_EXPIRE
+        )
+        redis_mock.publish.assert_awaited_once_with(
+            f"{settings.CANCEL_PREFIX}_1234", "Cancelled by user"
+        )
+
+    @patch("quantum_web.webapp.jobs.cache.client.get_client")
+    async def test_get_not_allowed(self, get_client_mock: Mock):
+        resp = await self.async_client.get("/api/cancel/1234")
+        self.assertEqual(resp.status_code, 405)
+        get_client_mock.assert_not_called()
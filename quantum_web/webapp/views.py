@@ -1,13 +1,36 @@
+import functools
 import uuid
 
 from django.conf import settings
-from django.core.cache import cache
-from django.http import JsonResponse
+from django.http import HttpResponseNotAllowed, JsonResponse
+
+from .jobs import cancel_job, get_redis
+
+
+def require_POST(view):
+    """Async version of `django.views.decorators.http.require_POST`.
+
+    Django decorators support async views only since 5.0.
+    """
+    @functools.wraps(view)
+    async def inner(request, *args, **kwargs):
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        return await view(request, *args, **kwargs)
+
+    return inner
 
 
 async def start(request):
     """Schedule a new job."""
     job_id = str(uuid.uuid4())
-    redis_client = await cache.client.get_client()
+    redis_client = await get_redis()
     await redis_client.rpush(settings.JOB_QUEUE, job_id)
     return JsonResponse({"job_id": job_id})
+
+
+@require_POST
+async def cancel(request, job_id):
+    """Cancel a scheduled or running job."""
+    await cancel_job(job_id, "Cancelled by user")
+    return JsonResponse({"job_id": job_id})
@@ -1,9 +1,14 @@
+import functools
 import logging
+import os
+import signal
+import time
 from multiprocessing import Pool
 
 from django.conf import settings
 
-from quantum_web.worker.queues import JobQueue, log
+from quantum_web.worker.queues import JobQueue, ResultQueue, log
+from quantum_web.worker.scaling import ConcurrencyScaler, Slots
 from quantum_web.worker.worker import QuantumWorker
 
 
@@ -11,29 +16,119 @@ class QuantumListener:
     """Job listener.
 
     Listen to job queue and spawns subprocesses to handle received jobs.
+
+    A job is fetched only when a subprocess is free to run it, so jobs the worker can't
+    start yet stay in the queue for other workers.
+
+    Running jobs whose heartbeat expired are reaped: the hung subprocess is killed to free
+    its slot, the job is requeued or stopped.
+
+    With `adaptive` concurrency the pool has `max_concurrency` subprocesses, but the number
+    of job slots is adapted to the load by `ConcurrencyScaler` every `scale_interval` seconds.
     """
-    def __init__(self, max_concurrency: int = settings.WORKER_MAX_CONCURRENCY):
+    def __init__(
+        self,
+        max_concurrency: int = settings.WORKER_MAX_CONCURRENCY,
+        poll_timeout: int = settings.WORKER_POLL_TIMEOUT,
+        recovery_interval: int = settings.WORKER_RECOVERY_INTERVAL,
+        adaptive: bool = settings.WORKER_ADAPTIVE_CONCURRENCY,
+        min_concurrency: int = settings.WORKER_MIN_CONCURRENCY,
+        scale_interval: float = settings.WORKER_SCALE_INTERVAL
+    ):
         self.queue = JobQueue()
         self.max_concurrency = max_concurrency
+        self.poll_timeout = poll_timeout
+        self.recovery_interval = recovery_interval
+        self.scale_interval = scale_interval
+        self.scaler = None
+        if adaptive:
+            self.scaler = ConcurrencyScaler(min(min_concurrency, max_concurrency), max_concurrency)
+        self.slots = Slots(self.scaler.limit if self.scaler else max_concurrency)
+        self.last_scale = 0.0
+        #: ids of jobs holding a slot
+        self.running: set[str] = set()
+        self.last_recovery = 0.0
 
     def run(self) -> None:
         """Start worker.
 
         Listen to job queue and spawn new processes in the pool.
         """
-        logging.info("Starting QuantumListener with %i subprocesses",
-                     self.max_concurrency)
+        logging.info("Starting QuantumListener %s with %i subprocesses",
+                     self.queue.worker_id, self.max_concurrency)
         with Pool(self.max_concurrency) as pool:
             while True:
-                job = self.queue.get()
+                self.housekeeping()
+                if not self.slots.acquire(timeout=self.poll_timeout):
+                    continue
+                job = self.queue.get(timeout=self.poll_timeout)
+                if job is None:
+                    self.slots.release()
+                    continue
                 log.info("Job received (job_id=%s)", job)
-                pool.apply_async(self.handle_job, [job])
+                self.running.add(job)
+                done = functools.partial(self.job_done, job)
+                pool.apply_async(
+                    self.handle_job, [job, self.queue.worker_id],
+                    callback=done, error_callback=done,
+                )
+
+    def housekeeping(self):
+        """Keep the worker alive, requeue jobs of dead workers, reap hung jobs and adapt
+        concurrency from time to time."""
+        self.queue.heartbeat()
+        if time.monotonic() - self.last_recovery >= self.recovery_interval:
+            self.last_recovery = time.monotonic()
+            self.queue.recover()
+            for job_id, owner in self.queue.reap():
+                self.reap(job_id, owner)
+        if self.scaler is not None and time.monotonic() - self.last_scale >= self.scale_interval:
+            self.last_scale = time.monotonic()
+            self.slots.resize(self.scaler.update(self.queue.length(), self.slots.busy))
+
+    def reap(self, job_id: str, owner: dict):
+        """Stop hung job of this worker, requeue the job or send STOP to its clients.
+
+        The job is unregistered only after that, a failed attempt is repeated by a later
+        sweep once the reaping claim expires.
+        """
+        if owner["worker"] == self.queue.worker_id and job_id in self.running:
+            log.warning("Killing hung process %i (job_id=%s)", owner["pid"], job_id)
+            try:
+                os.kill(owner["pid"], signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.release(job_id)
+        try:
+            if not self.queue.requeue(job_id, owner["worker"]):
+                ResultQueue(job_id).put_stop("Worker stopped responding")
+            self.queue.reaped(job_id)
+        except Exception:  # noqa
+            log.exception("Failed to reap job %s, retrying later", job_id)
+
+    def job_done(self, job_id: str, result: object = None):
+        """Acknowledge finished job and free its slot (called in the pool result thread).
+
+        `result` is the return value or the exception of the job, it isn't used.
+        """
+        log.debug("Job done (job_id=%s)", job_id)
+        if self.release(job_id):
+            self.queue.ack(job_id)
+
+    def release(self, job_id: str) -> bool:
+        """Free the slot of the job unless it is already free."""
+        try:
+            self.running.remove(job_id)
+        except KeyError:
+            return False
+        self.slots.release()
+        return True
 
     @staticmethod
-    def handle_job(job_id):
+    def handle_job(job_id, worker_id=None):
         """Handle job in a separate process.
 
         This method MUST BE static in order to prevent serialization issues.
         """
-        p = QuantumWorker(job_id)
+        p = QuantumWorker(job_id, worker_id)
         p.run()
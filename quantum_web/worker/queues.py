@@ -1,9 +1,18 @@
+import collections
 import enum
+import json
 import logging
+import os
+import socket
+import threading
+import time
+import uuid
 from datetime import datetime
+from typing import cast
 
 from django.conf import settings
 from redis.client import Redis
+from redis.exceptions import WatchError
 
 log = logging.getLogger(__name__)
 redis = Redis(
@@ -30,6 +39,12 @@ class ResultQueue:
     Abstraction and interface around redis stream with quantum process results.
 
     Streams will be removed after `ttl` seconds if no new messages published.
+
+    The stream is trimmed (approximately) to `maxlen` messages. A compact summary stream
+    keeps START, STOP and solutions published at log-spaced moments of time, the first
+    after `summary_interval` seconds and then each `summary_growth` times later, for late
+    subscribers to replay the history. Summary messages carry the id of the stream message
+    in the `stream_id` field, so the stream can be read on from the last summary message.
     """
     #: flag indicating queue received the last STOP message
     stopped = False
@@ -38,11 +53,23 @@ class ResultQueue:
         self,
         job_id: str,
         prefix: str = settings.RESULT_QUEUE_PREFIX,
-        ttl: int = settings.RESULT_QUEUE_EXPIRE
+        ttl: int = settings.RESULT_QUEUE_EXPIRE,
+        maxlen: int = settings.RESULT_STREAM_MAXLEN,
+        summary_maxlen: int = settings.RESULT_SUMMARY_MAXLEN,
+        summary_interval: float = settings.RESULT_SUMMARY_INTERVAL,
+        summary_growth: float = settings.RESULT_SUMMARY_GROWTH
     ):
         self.job_id = job_id
         self.ttl = ttl
         self.stream_name = f"{prefix}_{job_id}"
+        self.summary_name = f"{prefix}_{job_id}_summary"
+        self.maxlen = maxlen
+        self.summary_maxlen = summary_maxlen
+        self.summary_growth = summary_growth
+        self.next_summary = summary_interval
+        #: the last solution left out of the summary, added before STOP
+        self.skipped: tuple[str, dict] | None = None
+        self.created = time.monotonic()
 
     def put_start(self):
         """Put START event to the stream."""
@@ -68,35 +95,495 @@ class ResultQueue:
         redis.expire(self.stream_name, self.ttl)
 
     def put(self, event_type: EventType, **kwargs):
-        """Put message to the stream (internal).
+        """Put message to the stream (internal)."""
+        self.put_many([(event_type, kwargs)])
+
+    def put_many(self, events: list[tuple[EventType, dict]]):
+        """Put several messages to the stream in one round trip (internal).
 
-        Make sure we didn't send STOP message and reset stream ttl.
+        Make sure we didn't send STOP message and STOP is the last message of the batch,
+        messages and streams ttl reset are pipelined. Message ids are assigned by redis, so
+        summary messages are pipelined once the ids are known.
         """
         if self.stopped:
             raise RuntimeError("Trying to put message in the stream "
                                "while STOP message already sent.")
-        log.debug("Send message with type %s (kwargs: %s) to the stream %s",
-                  event_type, kwargs, self.stream_name)
-        redis.xadd(self.stream_name, {
-            "type": event_type.value,
-            **kwargs
-        })
-        self.reset_expire()
+        if any(event_type == EventType.STOP for event_type, _ in events[:-1]):
+            raise RuntimeError("STOP must be the last message in the stream.")
+        pipe = redis.pipeline(transaction=False)
+        messages = []
+        for event_type, kwargs in events:
+            log.debug("Send message with type %s (kwargs: %s) to the stream %s",
+                      event_type, kwargs, self.stream_name)
+            fields = {
+                "type": event_type.value,
+                **kwargs
+            }
+            pipe.xadd(self.stream_name, fields, maxlen=self.maxlen, approximate=True)
+            messages.append((event_type, fields))
+        pipe.expire(self.stream_name, self.ttl)
+        pipe.expire(self.summary_name, self.ttl)
+        msg_ids = pipe.execute()[:len(messages)]
+
+        summary = [
+            summary_message
+            for msg_id, (event_type, fields) in zip(msg_ids, messages)
+            for summary_message in self.summarize(msg_id, event_type, fields)
+        ]
+        if summary:
+            pipe = redis.pipeline(transaction=False)
+            for msg_id, fields in summary:
+                pipe.xadd(self.summary_name, {**fields, "stream_id": msg_id},
+                          maxlen=self.summary_maxlen, approximate=True)
+            pipe.expire(self.summary_name, self.ttl)
+            pipe.execute()
+        if events and events[-1][0] == EventType.STOP:
+            self.stopped = True
+
+    def summarize(
+        self, msg_id: str, event_type: EventType, fields: dict
+    ) -> list[tuple[str, dict]]:
+        """Select messages to put to the summary stream by their stream ids (internal)."""
+        if event_type == EventType.SOLUTION:
+            elapsed = time.monotonic() - self.created
+            if elapsed < self.next_summary:
+                self.skipped = msg_id, fields
+                return []
+            self.next_summary = elapsed * self.summary_growth
+            self.skipped = None
+            return [(msg_id, fields)]
+        # the summary ends with the final solution
+        messages: list[tuple[str, dict]] = []
+        if event_type == EventType.STOP and self.skipped:
+            messages.append(self.skipped)
+        self.skipped = None
+        return messages + [(msg_id, fields)]
+
+
+class ResultPublisher:
+    """Publish result queue messages from a background thread.
+
+    Has the same interface as `ResultQueue`, but messages are only put to a bounded
+    buffer, so solver callbacks never wait on redis. The publisher thread sends the
+    buffered messages in pipelined batches and STOP always as the last one.
+
+    When the buffer is full the oldest solution is dropped, solutions only improve and
+    the latest one is the most valuable. The batch with STOP is retried up to
+    `stop_retries` times, clients wait for STOP until the stream expires.
+    """
+    #: retries of the batch with STOP and delay between them (seconds)
+    stop_retries = 3
+    retry_delay = 0.5
+
+    def __init__(self, queue: ResultQueue, buffer_size: int = settings.RESULT_PUBLISH_BUFFER):
+        self.queue = queue
+        self.buffer_size = buffer_size
+        self.events: collections.deque[tuple[EventType, dict]] = collections.deque()
+        self.condition = threading.Condition()
+        #: reason of the STOP message once it is requested
+        self.stop_reason: str | None = None
+        #: flag indicating STOP message is sent to redis
+        self.stop_sent = False
+        self.dropped = 0
+        self.thread: threading.Thread | None = None
+
+    @property
+    def stopped(self) -> bool:
+        """Flag indicating STOP message is requested, no more messages accepted."""
+        return self.stop_reason is not None
+
+    def start(self):
+        """Start publisher thread."""
+        self.thread = threading.Thread(
+            target=self.run, name=f"result-publisher-{self.queue.job_id}", daemon=True
+        )
+        self.thread.start()
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Wait until all messages including STOP are sent, return False if STOP isn't sent.
+
+        STOP must be requested before, otherwise the publisher never finishes.
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                log.error("Result publisher of %s didn't finish in %s seconds",
+                          self.queue.stream_name, timeout)
+        if self.dropped:
+            log.info("%i solutions of %s were dropped by the full buffer",
+                     self.dropped, self.queue.stream_name)
+        if not self.stop_sent:
+            log.error("STOP message of %s was not sent, clients wait until the stream expires",
+                      self.queue.stream_name)
+        return self.stop_sent
+
+    def put_start(self):
+        """Put START event to the buffer."""
+        self.put(EventType.START)
+
+    def put_solution(self, energy: float, date: datetime | None = None):
+        """Put SOLUTION event to the buffer."""
+        if date is None:
+            date = datetime.now()
+        self.put(EventType.SOLUTION, date=date.isoformat(), energy=energy)
+
+    def put_stop(self, reason=""):
+        """Request STOP event, it is sent after all buffered messages."""
+        with self.condition:
+            self.check_stopped()
+            self.stop_reason = reason
+            self.condition.notify()
+
+    def put(self, event_type: EventType, **kwargs):
+        """Put message to the buffer (internal)."""
+        with self.condition:
+            self.check_stopped()
+            oldest = next((e for e in self.events if e[0] == EventType.SOLUTION), None)
+            if len(self.events) >= self.buffer_size and oldest is not None:
+                self.events.remove(oldest)
+                self.dropped += 1
+            self.events.append((event_type, kwargs))
+            self.condition.notify()
+
+    def check_stopped(self):
+        if self.stopped:
+            raise RuntimeError("Trying to put message in the stream "
+                               "while STOP message already sent.")
+
+    def run(self):
+        """Send buffered messages until STOP is sent (publisher thread)."""
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.events or self.stopped)
+                batch = list(self.events)
+                self.events.clear()
+                if self.stopped:
+                    batch.append((EventType.STOP, {"reason": self.stop_reason}))
+            if batch[-1][0] == EventType.STOP:
+                self.stop_sent = self.publish(batch, retries=self.stop_retries)
+                return
+            self.publish(batch)
+
+    def publish(self, batch: list[tuple[EventType, dict]], retries: int = 0) -> bool:
+        """Send a batch of messages, return False if it failed (publisher thread)."""
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay)
+            try:
+                self.queue.put_many(batch)
+                return True
+            except Exception:  # noqa
+                log.exception("Failed to publish %i messages to %s (attempt %i of %i)",
+                              len(batch), self.queue.stream_name, attempt + 1, retries + 1)
+        return False
 
 
 class JobQueue:
     """Queue with jobs to process.
 
     Abstraction and an interface around redis.
+
+    A received job is atomically moved to the processing list of the worker and stays
+    there until it is acknowledged, so a job is never lost with its worker. Every worker
+    keeps a liveness key alive with `heartbeat()`, `recover()` moves jobs of workers
+    whose liveness key expired back to the queue.
+
+    Running jobs are registered with their worker and keep their own heartbeat alive (see
+    `JobHeartbeat`), `reap()` claims running jobs whose heartbeat expired. A reaped job stays
+    registered until `reaped()`, so if the reaping worker fails, the claim expires and
+    the job is reaped again.
     """
-    def __init__(self, queue_name: str = settings.JOB_QUEUE):
+    def __init__(
+        self,
+        queue_name: str = settings.JOB_QUEUE,
+        worker_id: str | None = None,
+        liveness_ttl: int = settings.WORKER_LIVENESS_TTL
+    ):
         self.queue_name = queue_name
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.liveness_ttl = liveness_ttl
+        self.workers_key = f"{queue_name}:workers"
+        self.processing = self.get_processing_name(self.worker_id)
+        self.running_key = f"{queue_name}:running"
+
+    def get_processing_name(self, worker_id: str) -> str:
+        """Get processing list name of the worker."""
+        return f"{self.queue_name}:processing:{worker_id}"
+
+    def get_liveness_name(self, worker_id: str) -> str:
+        """Get liveness key name of the worker."""
+        return f"{self.queue_name}:alive:{worker_id}"
+
+    def get_heartbeat_name(self, job_id: str) -> str:
+        """Get heartbeat key name of the running job."""
+        return f"{self.queue_name}:heartbeat:{job_id}"
+
+    def get_reaping_name(self, job_id: str) -> str:
+        """Get reaping claim key name of the job."""
+        return f"{self.queue_name}:reaping:{job_id}"
+
+    def get_attempts_name(self, job_id: str) -> str:
+        """Get requeue attempts counter name of the job."""
+        return f"{self.queue_name}:attempts:{job_id}"
+
+    def get(self, timeout: float = 0) -> str | None:
+        """Get next task id to process and move it to the processing list.
+
+        Block until new tasks will be received or `timeout` seconds passed (0 blocks
+        indefinitely), return None on timeout.
+        """
+        # responses are decoded to str by the client
+        return cast(
+            str | None, redis.blmove(self.queue_name, self.processing, timeout, "LEFT", "RIGHT")
+        )
+
+    def length(self) -> int:
+        """Get number of queued jobs."""
+        return redis.llen(self.queue_name)
+
+    def ack(self, job_id: str):
+        """Acknowledge the job is done, remove it from the processing list."""
+        redis.lrem(self.processing, 1, job_id)
+
+    def heartbeat(self):
+        """Register the worker and keep it alive for `liveness_ttl` seconds."""
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(self.get_liveness_name(self.worker_id), 1, ex=self.liveness_ttl)
+        pipe.sadd(self.workers_key, self.worker_id)
+        pipe.execute()
+
+    def recover(self) -> list[str]:
+        """Requeue jobs held by dead workers and return their ids.
+
+        A job is moved from the processing list back to the queue in a transaction, which
+        fails if another worker changed the list first, so concurrent recovery by several
+        workers never duplicates or loses a job. The dead worker is forgotten once all its
+        jobs are moved. Running jobs are left to `reap()`.
+        """
+        recovered = []
+        for worker_id in redis.smembers(self.workers_key):
+            if worker_id == self.worker_id or redis.exists(self.get_liveness_name(worker_id)):
+                continue
+            processing = self.get_processing_name(worker_id)
+            complete = True
+            for job_id in redis.lrange(processing, 0, -1):
+                if redis.hexists(self.running_key, job_id):
+                    continue
+                if not self.move_to_queue(processing, job_id):
+                    complete = False
+                    continue
+                log.warning("Requeue job %s of dead worker %s", job_id, worker_id)
+                recovered.append(job_id)
+            if complete:
+                redis.srem(self.workers_key, worker_id)
+        return recovered
+
+    def move_to_queue(self, processing: str, job_id: str) -> bool:
+        """Move the job from the processing list to the queue atomically.
+
+        Return False if the job is not in the list or the list changed meanwhile.
+        """
+        with redis.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(processing)
+                if pipe.lpos(processing, job_id) is None:
+                    return False
+                pipe.multi()
+                pipe.lrem(processing, 1, job_id)
+                pipe.lpush(self.queue_name, job_id)
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def reap(self) -> list[tuple[str, dict]]:
+        """Claim running jobs whose heartbeat expired, return their ids and owners.
+
+        Jobs of other live workers are left to their workers, which can also stop the hung
+        process. A job is claimed with a key expiring in `liveness_ttl` seconds, only one
+        worker succeeds. The claimed job must be requeued or stopped and then `reaped()`.
+        """
+        reaped = []
+        for job_id, owner in redis.hgetall(self.running_key).items():
+            owner = json.loads(owner)
+            worker_id = owner["worker"]
+            if redis.exists(self.get_heartbeat_name(job_id)):
+                continue
+            if worker_id != self.worker_id and redis.exists(self.get_liveness_name(worker_id)):
+                continue
+            if redis.set(self.get_reaping_name(job_id), self.worker_id, nx=True,
+                         ex=self.liveness_ttl):
+                log.warning("Job %s of worker %s stopped sending heartbeats", job_id, worker_id)
+                reaped.append((job_id, owner))
+        return reaped
+
+    def reaped(self, job_id: str):
+        """Unregister the reaped job once it is requeued or stopped."""
+        pipe = redis.pipeline(transaction=False)
+        pipe.hdel(self.running_key, job_id)
+        pipe.delete(self.get_reaping_name(job_id))
+        pipe.execute()
+
+    def requeue(
+        self, job_id: str, worker_id: str, max_retries: int = settings.JOB_MAX_RETRIES
+    ) -> bool:
+        """Remove reaped job from the worker processing list and requeue it.
+
+        Job is requeued at most `max_retries` times, return False if it is given up.
+        """
+        processing = self.get_processing_name(worker_id)
+        attempts = redis.incr(self.get_attempts_name(job_id))
+        redis.expire(self.get_attempts_name(job_id), settings.RESULT_QUEUE_EXPIRE)
+        if attempts > max_retries:
+            redis.lrem(processing, 1, job_id)
+            return False
+        pipe = redis.pipeline()
+        pipe.lrem(processing, 1, job_id)
+        pipe.lpush(self.queue_name, job_id)
+        pipe.execute()
+        log.warning("Requeue job %s (attempt %i of %i)", job_id, attempts, max_retries)
+        return True
+
+
+class JobHeartbeat:
+    """Running job heartbeat.
+
+    Registers the job as running by the worker and refreshes its heartbeat key with job
+    progress from a background thread every `interval` seconds, the key expires in `ttl`
+    seconds once the process hangs or dies.
+
+    Progress is updated with `update()`, which never touches redis, so it can be called
+    from solver callbacks. The heartbeat isn't refreshed once progress wasn't updated for
+    `progress_ttl` seconds, so a solver stuck in the job process lets the key expire too.
+    None keeps the heartbeat alive regardless of progress.
+    """
+    #: number of candidates evaluated by the solver
+    evaluations: int | None = None
+    #: best energy found
+    energy: float | None = None
+
+    def __init__(
+        self,
+        job_id: str,
+        queue: JobQueue,
+        ttl: int = settings.JOB_HEARTBEAT_TTL,
+        interval: float = settings.JOB_HEARTBEAT_INTERVAL,
+        progress_ttl: float | None = settings.JOB_HEARTBEAT_TTL
+    ):
+        self.job_id = job_id
+        self.queue = queue
+        self.key = queue.get_heartbeat_name(job_id)
+        self.ttl = ttl
+        self.interval = interval
+        self.progress_ttl = progress_ttl
+        #: time of the last progress update
+        self.progressed = time.monotonic()
+        self.event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def start(self):
+        """Register the running job and start sending heartbeats."""
+        owner = {"worker": self.queue.worker_id, "pid": os.getpid()}
+        self.progressed = time.monotonic()
+        pipe = redis.pipeline(transaction=False)
+        pipe.hset(self.queue.running_key, self.job_id, json.dumps(owner))
+        self.beat(pipe)
+        self.thread = threading.Thread(
+            target=self.run, name=f"heartbeat-{self.job_id}", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """Stop sending heartbeats and unregister the job."""
+        self.event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        pipe = redis.pipeline(transaction=False)
+        pipe.hdel(self.queue.running_key, self.job_id)
+        pipe.delete(self.key)
+        pipe.execute()
+
+    def update(self, evaluations: int | None = None, energy: float | None = None):
+        """Update job progress, sent with the next heartbeat."""
+        self.progressed = time.monotonic()
+        if evaluations is not None:
+            self.evaluations = evaluations
+        if energy is not None:
+            self.energy = energy
+
+    @property
+    def stale(self) -> bool:
+        """Flag indicating progress wasn't updated for `progress_ttl` seconds."""
+        return self.progress_ttl is not None and \
+            time.monotonic() - self.progressed > self.progress_ttl
+
+    def run(self):
+        while not self.event.wait(self.interval):
+            if self.stale:
+                log.warning("Job %s made no progress for %.0f seconds, heartbeat not sent",
+                            self.job_id, time.monotonic() - self.progressed)
+                continue
+            try:
+                self.beat(redis.pipeline(transaction=False))
+            except Exception:  # noqa
+                log.exception("Failed to send heartbeat of job %s", self.job_id)
+
+    def beat(self, pipe):
+        progress = {"updated": datetime.now().isoformat()}
+        if self.evaluations is not None:
+            progress["evaluations"] = self.evaluations
+        if self.energy is not None:
+            progress["energy"] = self.energy
+        pipe.hset(self.key, mapping=progress)
+        pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+
+class CancelSignal:
+    """Job cancellation signal.
+
+    Cancellation is requested by the webapp (see `webapp.jobs.cancel_job`) setting a key
+    with the reason, so a job cancelled before it started is stopped right away, and
+    publishing the reason to the channel with the same name to notify a running job.
+
+    Implements `is_set()` and can be passed to the solver as a cancellation token.
+    """
+    #: cancellation reason, set once cancellation is received
+    reason: str | None = None
+
+    def __init__(
+        self,
+        job_id: str,
+        prefix: str = settings.CANCEL_PREFIX
+    ):
+        self.key = f"{prefix}_{job_id}"
+        self.event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start watching for cancellation in a background thread."""
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        # subscribe before reading the key, so a request made in between is not lost
+        pubsub.subscribe(**{self.key: self.on_message})
+        reason = redis.get(self.key)
+        if reason is not None:
+            self.set(reason)
+        self.thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def stop(self):
+        """Stop watching for cancellation."""
+        if self.thread is not None:
+            self.thread.stop()
+            self.thread = None
+
+    def on_message(self, message: dict):
+        self.set(message["data"])
 
-    def get(self):
-        """Get next task id to process.
+    def set(self, reason: str):
+        log.info("Job cancellation received (key=%s, reason=%s)", self.key, reason)
+        self.reason = reason
+        self.event.set()
 
-                Block until new tasks will be received.
-                """
-        _, job_id = redis.blpop(self.queue_name)
-        job_id = job_id
-        return job_id
+    def is_set(self) -> bool:
+        return self.event.is_set()
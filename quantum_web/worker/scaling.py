@@ -0,0 +1,202 @@
+import logging
+import os
+import threading
+import time
+from multiprocessing import active_children
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def cpu_count() -> int:
+    """Number of CPUs available to the process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cpu_time(pid: int) -> float | None:
+    """CPU time used by the process (seconds), None if unknown.
+
+    Read from procfs, so only available on linux.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # fields after the command name, which can contain spaces; utime and stime are 14th and 15th
+    fields = stat[stat.rindex(")") + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def resident_memory(pid: int) -> int | None:
+    """Resident memory of the process (bytes), None if unknown."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def available_memory() -> int | None:
+    """Memory available for new processes (bytes), None if unknown.
+
+    The host available memory limited by the cgroup (container) memory limit.
+    """
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        return None
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f:
+            current = int(f.read())
+    except OSError:
+        return available
+    if limit == "max":
+        return available
+    headroom = int(limit) - current
+    return headroom if available is None else min(available, headroom)
+
+
+class Slots:
+    """Semaphore with adjustable number of slots.
+
+    Shrinking below the number of acquired slots doesn't affect holders, new slots are
+    given out once enough of them are released.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        #: number of acquired slots
+        self.busy = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Acquire a slot, return False if no slot got free in `timeout` seconds."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.busy < self.limit, timeout):
+                return False
+            self.busy += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.busy -= 1
+            self.condition.notify()
+
+    def resize(self, limit: int):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+
+class ConcurrencyScaler:
+    """Adaptive number of job slots.
+
+    The number of slots is changed by one between `min_concurrency` and `max_concurrency`
+    on every `update()`:
+
+    * shrink while available memory is below `min_free_memory`;
+    * shrink while jobs get less than `cpu_low` of a CPU each (CPUs are oversubscribed);
+    * grow while jobs are queued, all slots are busy and one more job fits into
+      `cpu_target` of host CPUs and into available memory;
+    * shrink while the queue is empty and slots are idle.
+
+    CPU utilisation and memory of jobs are measured over pool subprocesses, metrics unknown
+    on the platform are not taken into account.
+    """
+    def __init__(
+        self,
+        min_concurrency: int = settings.WORKER_MIN_CONCURRENCY,
+        max_concurrency: int = settings.WORKER_MAX_CONCURRENCY,
+        cpu_target: float = settings.WORKER_SCALE_CPU_TARGET,
+        cpu_low: float = settings.WORKER_SCALE_CPU_LOW,
+        min_free_memory: int = settings.WORKER_MIN_FREE_MEMORY
+    ):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.cpu_target = cpu_target
+        self.cpu_low = cpu_low
+        self.min_free_memory = min_free_memory
+        self.cpus = cpu_count()
+        self.limit = min_concurrency
+        #: time and CPU time of subprocesses at the previous sample
+        self.last_sample: tuple[float, dict[int, float]] | None = None
+
+    def sample(self, busy: int) -> tuple[float | None, int | None]:
+        """Measure CPU utilisation per running job since the previous sample and job memory.
+
+        CPU time is divided between subprocesses whose CPU time advanced, so slots busy for
+        a part of the interval only and idle subprocesses don't dilute the utilisation.
+        Job memory is the largest resident memory of subprocesses.
+        """
+        now = time.monotonic()
+        pids = [p.pid for p in active_children() if p.pid is not None]
+        cpu_times = {pid: t for pid in pids if (t := cpu_time(pid)) is not None}
+        memory = [m for pid in pids if (m := resident_memory(pid)) is not None]
+        utilisation = None
+        if self.last_sample is not None and busy and cpu_times:
+            last_time, last_cpu_times = self.last_sample
+            used = [
+                t - last_cpu_times[pid] for pid, t in cpu_times.items()
+                if pid in last_cpu_times and t > last_cpu_times[pid]
+            ]
+            if used and now > last_time:
+                utilisation = sum(used) / (now - last_time) / len(used)
+        self.last_sample = now, cpu_times
+        return utilisation, max(memory, default=None)
+
+    def update(self, queue_length: int, busy: int) -> int:
+        """Sample metrics, decide the number of slots and log the decision."""
+        utilisation, job_memory = self.sample(busy)
+        free_memory = available_memory()
+        limit, reason = self.decide(queue_length, busy, utilisation, job_memory, free_memory)
+        log.log(
+            logging.INFO if limit != self.limit else logging.DEBUG,
+            "Concurrency %i -> %i: %s (queued %i, busy %i, CPU per job %s, job memory %s, "
+            "available memory %s)",
+            self.limit, limit, reason, queue_length, busy,
+            "-" if utilisation is None else "%.2f" % utilisation,
+            "-" if job_memory is None else "%i MiB" % (job_memory >> 20),
+            "-" if free_memory is None else "%i MiB" % (free_memory >> 20),
+        )
+        self.limit = limit
+        return limit
+
+    def decide(
+        self,
+        queue_length: int,
+        busy: int,
+        utilisation: float | None,
+        job_memory: int | None,
+        free_memory: int | None
+    ) -> tuple[int, str]:
+        """Get the next number of slots and the reason."""
+        shrunk = max(self.limit - 1, self.min_concurrency)
+        if free_memory is not None and free_memory < self.min_free_memory:
+            return shrunk, "low memory"
+        if utilisation is not None and busy > 1 and utilisation < self.cpu_low:
+            return shrunk, "CPU contention"
+        if queue_length and busy >= self.limit:
+            if self.limit >= self.max_concurrency:
+                return self.limit, "maximum concurrency reached"
+            if utilisation is not None and (busy + 1) * utilisation > self.cpus * self.cpu_target:
+                return self.limit, "no CPU headroom"
+            if free_memory is not None and job_memory is not None and \
+                    free_memory - job_memory < self.min_free_memory:
+                return self.limit, "no memory headroom"
+            return self.limit + 1, "jobs queued"
+        if not queue_length and busy < self.limit:
+            return shrunk, "idle slots"
+        return self.limit, "steady load"
@@ -1,3 +1,4 @@
+import signal
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
@@ -11,6 +12,9 @@ class NormalStopException(Exception):
 class ListenerTest(TestCase):
     def setUp(self) -> None:
         self.listener = QuantumListener()
+        patcher = patch("quantum_web.worker.listener.JobQueue.reap", return_value=[])
+        self.reap_mock = patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch("quantum_web.worker.listener.QuantumWorker.run")
     def test_handle_job(self, worker_run_mock: MagicMock):
@@ -22,10 +26,117 @@ class ListenerTest(TestCase):
            side_effect=NormalStopException())
     @patch("quantum_web.worker.listener.JobQueue.get",
            return_value='1234')
-    def test_run(self, get_mock: MagicMock, apply_async_mock: MagicMock):
+    @patch("quantum_web.worker.listener.JobQueue.recover")
+    @patch("quantum_web.worker.listener.JobQueue.heartbeat")
+    def test_run(self, heartbeat_mock: MagicMock, recover_mock: MagicMock, get_mock: MagicMock,
+                 apply_async_mock: MagicMock):
         try:
             self.listener.run()
         except NormalStopException:
             pass
+        heartbeat_mock.assert_called_once()
+        recover_mock.assert_called_once()
         get_mock.assert_called_once()
-        apply_async_mock.assert_called_once_with(self.listener.handle_job, ['1234'])
+        apply_async_mock.assert_called_once()
+        self.assertEqual(apply_async_mock.call_args.args,
+                         (self.listener.handle_job, ['1234', self.listener.queue.worker_id]))
+        callback = apply_async_mock.call_args.kwargs["callback"]
+        self.assertEqual((callback.func, callback.args), (self.listener.job_done, ('1234',)))
+
+    @patch("multiprocessing.pool.Pool.apply_async")
+    @patch("quantum_web.worker.listener.JobQueue.get", side_effect=[None, NormalStopException()])
+    @patch("quantum_web.worker.listener.JobQueue.recover")
+    @patch("quantum_web.worker.listener.JobQueue.heartbeat")
+    def test_run_no_job(self, heartbeat_mock: MagicMock, recover_mock: MagicMock,
+                        get_mock: MagicMock, apply_async_mock: MagicMock):
+        with self.assertRaises(NormalStopException):
+            self.listener.run()
+        self.assertEqual(get_mock.call_count, 2)
+        apply_async_mock.assert_not_called()
+
+    @patch("multiprocessing.pool.Pool.apply_async")
+    @patch("quantum_web.worker.listener.JobQueue.get", side_effect=['1234', '5678', '9012'])
+    @patch("quantum_web.worker.listener.JobQueue.recover")
+    @patch("quantum_web.worker.listener.JobQueue.heartbeat")
+    def test_run_no_free_slot(self, heartbeat_mock: MagicMock, recover_mock: MagicMock,
+                              get_mock: MagicMock, apply_async_mock: MagicMock):
+        self.listener = QuantumListener(max_concurrency=2, poll_timeout=0)
+        # stop on the third housekeeping, both slots are taken since the first two jobs
+        heartbeat_mock.side_effect = [None, None, None, NormalStopException()]
+        with self.assertRaises(NormalStopException):
+            self.listener.run()
+        self.assertEqual(get_mock.call_count, 2)
+        self.assertEqual(apply_async_mock.call_count, 2)
+
+    @patch("quantum_web.worker.listener.JobQueue.length", return_value=5)
+    @patch("quantum_web.worker.listener.ConcurrencyScaler.update", return_value=3)
+    @patch("quantum_web.worker.listener.JobQueue.recover")
+    @patch("quantum_web.worker.listener.JobQueue.heartbeat")
+    def test_housekeeping_adaptive(self, heartbeat_mock: MagicMock, recover_mock: MagicMock,
+                                   update_mock: MagicMock, length_mock: MagicMock):
+        self.listener = QuantumListener(max_concurrency=4, adaptive=True, min_concurrency=1)
+        self.assertEqual(self.listener.slots.limit, 1)
+        self.listener.housekeeping()
+        update_mock.assert_called_once_with(5, 0)
+        self.assertEqual(self.listener.slots.limit, 3)
+        # not before the scale interval
+        self.listener.housekeeping()
+        update_mock.assert_called_once()
+
+    @patch("quantum_web.worker.listener.JobQueue.ack")
+    def test_job_done(self, ack_mock: MagicMock):
+        self.listener.slots.acquire()
+        self.listener.running.add('1234')
+        self.listener.job_done('1234')
+        ack_mock.assert_called_once_with('1234')
+        self.assertEqual(self.listener.slots.busy, 0)
+
+    @patch("quantum_web.worker.listener.JobQueue.reaped")
+    @patch("quantum_web.worker.listener.ResultQueue.put_stop")
+    @patch("quantum_web.worker.listener.JobQueue.requeue", return_value=False)
+    @patch("quantum_web.worker.listener.JobQueue.ack")
+    @patch("quantum_web.worker.listener.os.kill")
+    def test_reap_own_job(self, kill_mock: MagicMock, ack_mock: MagicMock,
+                          requeue_mock: MagicMock, put_stop_mock: MagicMock,
+                          reaped_mock: MagicMock):
+        self.listener.slots.acquire()
+        self.listener.running.add('1234')
+        self.listener.reap('1234', {"worker": self.listener.queue.worker_id, "pid": 4321})
+        kill_mock.assert_called_once_with(4321, signal.SIGKILL)
+        self.assertEqual(self.listener.slots.busy, 0)
+        requeue_mock.assert_called_once_with('1234', self.listener.queue.worker_id)
+        put_stop_mock.assert_called_once_with("Worker stopped responding")
+        reaped_mock.assert_called_once_with('1234')
+        # result of the killed process never frees the slot twice
+        self.listener.job_done('1234')
+        ack_mock.assert_not_called()
+        self.assertEqual(self.listener.slots.busy, 0)
+
+    @patch("quantum_web.worker.listener.JobQueue.reaped")
+    @patch("quantum_web.worker.listener.ResultQueue.put_stop")
+    @patch("quantum_web.worker.listener.JobQueue.requeue", return_value=True)
+    @patch("quantum_web.worker.listener.os.kill")
+    def test_reap_dead_worker_job(self, kill_mock: MagicMock, requeue_mock: MagicMock,
+                                  put_stop_mock: MagicMock, reaped_mock: MagicMock):
+        self.listener.reap('1234', {"worker": "dead-worker", "pid": 4321})
+        kill_mock.assert_not_called()
+        requeue_mock.assert_called_once_with('1234', "dead-worker")
+        put_stop_mock.assert_not_called()
+        reaped_mock.assert_called_once_with('1234')
+
+    @patch("quantum_web.worker.listener.JobQueue.reaped")
+    @patch("quantum_web.worker.listener.ResultQueue.put_stop", side_effect=ConnectionError())
+    @patch("quantum_web.worker.listener.JobQueue.requeue", return_value=False)
+    @patch("quantum_web.worker.listener.os.kill")
+    def test_reap_stop_failed(self, kill_mock: MagicMock, requeue_mock: MagicMock,
+                              put_stop_mock: MagicMock, reaped_mock: MagicMock):
+        self.listener.slots.acquire()
+        self.listener.running.add('1234')
+        owner = {"worker": self.listener.queue.worker_id, "pid": 4321}
+        with self.assertLogs("quantum_web.worker.queues", "ERROR"):
+            self.listener.reap('1234', owner)
+        # the job stays registered to be reaped again, the process isn't killed twice
+        reaped_mock.assert_not_called()
+        self.listener.reap('1234', owner)
+        kill_mock.assert_called_once()
+        self.assertEqual(self.listener.slots.busy, 0)
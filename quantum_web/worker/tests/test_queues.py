@@ -1,14 +1,27 @@
+import json
+import os
 from datetime import datetime
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
-from ..queues import EventType, JobQueue, ResultQueue
+from redis.exceptions import WatchError
+
+from ..queues import (
+    CancelSignal,
+    EventType,
+    JobHeartbeat,
+    JobQueue,
+    ResultPublisher,
+    ResultQueue,
+)
 
 
 class ResultQueueTest(TestCase):
     def setUp(self) -> None:
-        self.queue = ResultQueue('1234', prefix="example", ttl=60)
+        self.queue = ResultQueue('1234', prefix="example", ttl=60, maxlen=100, summary_maxlen=10,
+                                 summary_interval=0.1, summary_growth=2)
         self.stream_name = "example_1234"
+        self.summary_name = "example_1234_summary"
 
     @patch("quantum_web.worker.queues.ResultQueue.put")
     def test_put_start(self, put_mock: MagicMock):
@@ -42,15 +55,61 @@ class ResultQueueTest(TestCase):
         self.queue.reset_expire()
         expire_mock.assert_called_once()
 
-    @patch("quantum_web.worker.queues.redis.xadd")
-    @patch("quantum_web.worker.queues.ResultQueue.reset_expire")
-    def test_raw_put(self, expire_mock: MagicMock, xadd_mock: MagicMock):
+    @patch("quantum_web.worker.queues.redis.pipeline")
+    def test_raw_put(self, pipeline_mock: MagicMock):
         energy = -2.3123
+        pipe = pipeline_mock.return_value
+        pipe.execute.return_value = ["1-1", True, True]
         self.queue.put(EventType.SOLUTION, energy=energy)
-        xadd_mock.assert_called_once_with(self.stream_name, {
+        pipe.xadd.assert_called_once_with(self.stream_name, {
             "type": "solution",
             "energy": energy
-        })
+        }, maxlen=100, approximate=True)
+        pipe.expire.assert_any_call(self.stream_name, 60)
+        pipe.expire.assert_any_call(self.summary_name, 60)
+        pipe.execute.assert_called_once()
+
+    @patch("quantum_web.worker.queues.redis.pipeline")
+    def test_put_many(self, pipeline_mock: MagicMock):
+        pipe = pipeline_mock.return_value
+        pipe.execute.return_value = ["1-1", "1-2", "1-3", True, True]
+        self.queue.put_many([
+            (EventType.SOLUTION, {"energy": -1}),
+            (EventType.SOLUTION, {"energy": -2}),
+            (EventType.STOP, {"reason": ""}),
+        ])
+        messages = [c for c in pipe.xadd.call_args_list if c.args[0] == self.stream_name]
+        self.assertEqual([c.args[1]["type"] for c in messages], ["solution", "solution", "stop"])
+        self.assertTrue(all("id" not in c.kwargs for c in messages))
+        # summary messages are sent once redis assigned the stream ids
+        summary = [c for c in pipe.xadd.call_args_list if c.args[0] == self.summary_name]
+        self.assertEqual([c.args[1]["stream_id"] for c in summary], ["1-2", "1-3"])
+        self.assertEqual(pipe.execute.call_count, 2)
+        self.assertTrue(self.queue.stopped)
+
+    @patch("quantum_web.worker.queues.time.monotonic")
+    @patch("quantum_web.worker.queues.redis.pipeline")
+    def test_summary(self, pipeline_mock: MagicMock, monotonic_mock: MagicMock):
+        start = self.queue.created
+        # log-spaced in time: solutions at 0.1s, then not earlier than 0.2s, 0.4s, ...
+        pipe = pipeline_mock.return_value
+        pipe.execute.return_value = ["1-1", True, True]
+        events = [EventType.START] + [EventType.SOLUTION] * 7 + [EventType.STOP]
+        for elapsed, event in zip([0, 0.05, 0.15, 0.2, 0.35, 0.4, 0.5, 0.6, 1.0], events):
+            monotonic_mock.return_value = start + elapsed
+            self.queue.put_many([(event, {"elapsed": elapsed})])
+        summary = [c for c in pipe.xadd.call_args_list if c.args[0] == self.summary_name]
+        self.assertEqual([c.args[1]["elapsed"] for c in summary], [0, 0.15, 0.35, 0.6, 1.0])
+        self.assertEqual(summary[-1].args[1]["type"], "stop")
+        self.assertTrue(all(c.kwargs["maxlen"] == 10 and c.kwargs["approximate"] for c in summary))
+
+    @patch("quantum_web.worker.queues.redis.pipeline")
+    def test_put_many_stop_not_last(self, pipeline_mock: MagicMock):
+        with self.assertRaises(RuntimeError):
+            self.queue.put_many([
+                (EventType.STOP, {"reason": ""}), (EventType.SOLUTION, {"energy": -1})
+            ])
+        pipeline_mock.assert_not_called()
 
     @patch("quantum_web.worker.queues.redis.xadd")
     def test_raw_put_if_stopped(self, xadd_mock: MagicMock):
@@ -60,11 +119,271 @@ class ResultQueueTest(TestCase):
         xadd_mock.assert_not_called()
 
 
+class ResultPublisherTest(TestCase):
+    def setUp(self) -> None:
+        self.queue = ResultQueue('1234', prefix="example", ttl=60)
+        self.publisher = ResultPublisher(self.queue, buffer_size=3)
+        self.publisher.retry_delay = 0
+
+    @patch("quantum_web.worker.queues.ResultQueue.put_many")
+    def test_put_does_not_publish(self, put_many_mock: MagicMock):
+        self.publisher.put_start()
+        self.publisher.put_solution(-1.5)
+        self.assertEqual([e[0] for e in self.publisher.events],
+                         [EventType.START, EventType.SOLUTION])
+        put_many_mock.assert_not_called()
+
+    def test_full_buffer_drops_oldest_solution(self):
+        self.publisher.put_start()
+        for energy in (-1, -2, -3):
+            self.publisher.put_solution(energy)
+        self.assertEqual([e[0] for e in self.publisher.events],
+                         [EventType.START, EventType.SOLUTION, EventType.SOLUTION])
+        self.assertEqual([e[1]["energy"] for e in list(self.publisher.events)[1:]], [-2, -3])
+        self.assertEqual(self.publisher.dropped, 1)
+
+    def test_put_after_stop(self):
+        self.publisher.put_stop("Example reason")
+        self.assertTrue(self.publisher.stopped)
+        with self.assertRaises(RuntimeError):
+            self.publisher.put_solution(-1)
+        with self.assertRaises(RuntimeError):
+            self.publisher.put_stop()
+
+    @patch("quantum_web.worker.queues.ResultQueue.put_many")
+    def test_run_stop_last(self, put_many_mock: MagicMock):
+        self.publisher.put_start()
+        self.publisher.put_solution(-1)
+        self.publisher.put_stop("Example reason")
+        self.publisher.start()
+        self.assertTrue(self.publisher.close(timeout=5))
+        assert self.publisher.thread is not None
+        self.assertFalse(self.publisher.thread.is_alive())
+        events = [e for c in put_many_mock.call_args_list for e in c.args[0]]
+        self.assertEqual([e[0] for e in events],
+                         [EventType.START, EventType.SOLUTION, EventType.STOP])
+        self.assertEqual(events[-1][1], {"reason": "Example reason"})
+
+    @patch("quantum_web.worker.queues.ResultQueue.put_many",
+           side_effect=[ConnectionError(), None])
+    def test_run_publish_error(self, put_many_mock: MagicMock):
+        self.publisher.start()
+        self.publisher.put_solution(-1)
+        self.publisher.put_stop()
+        self.assertTrue(self.publisher.close(timeout=5))
+        assert self.publisher.thread is not None
+        self.assertFalse(self.publisher.thread.is_alive())
+        self.assertEqual(put_many_mock.call_args_list[-1].args[0][-1][0], EventType.STOP)
+
+    @patch("quantum_web.worker.queues.ResultQueue.put_many",
+           side_effect=[ConnectionError(), None])
+    def test_run_stop_retried(self, put_many_mock: MagicMock):
+        self.publisher.put_stop("Example reason")
+        self.publisher.start()
+        self.assertTrue(self.publisher.close(timeout=5))
+        self.assertEqual(put_many_mock.call_count, 2)
+        self.assertEqual(put_many_mock.call_args.args[0],
+                         [(EventType.STOP, {"reason": "Example reason"})])
+
+    @patch("quantum_web.worker.queues.ResultQueue.put_many", side_effect=ConnectionError())
+    def test_run_stop_not_sent(self, put_many_mock: MagicMock):
+        self.publisher.put_stop()
+        self.publisher.start()
+        with self.assertLogs("quantum_web.worker.queues", "ERROR") as logs:
+            self.assertFalse(self.publisher.close(timeout=5))
+        self.assertEqual(put_many_mock.call_count, self.publisher.stop_retries + 1)
+        self.assertIn("STOP message of example_1234 was not sent", logs.output[-1])
+
+
 class JobQueueTest(TestCase):
     def setUp(self) -> None:
-        self.queue = JobQueue()
+        self.queue = JobQueue("jobs", worker_id="worker-1", liveness_ttl=30)
 
-    @patch("quantum_web.worker.queues.redis.blpop", return_value=('any', '1234'))
-    def test_get(self, blpop_mock: MagicMock):
+    @patch("quantum_web.worker.queues.redis.blmove", return_value='1234')
+    def test_get(self, blmove_mock: MagicMock):
         self.assertEqual(self.queue.get(), '1234')
-        blpop_mock.assert_called_once()
+        blmove_mock.assert_called_once_with("jobs", "jobs:processing:worker-1", 0, "LEFT", "RIGHT")
+
+    @patch("quantum_web.worker.queues.redis.blmove", return_value=None)
+    def test_get_timeout(self, blmove_mock: MagicMock):
+        self.assertIsNone(self.queue.get(timeout=1))
+
+    @patch("quantum_web.worker.queues.redis.lrem")
+    def test_ack(self, lrem_mock: MagicMock):
+        self.queue.ack('1234')
+        lrem_mock.assert_called_once_with("jobs:processing:worker-1", 1, '1234')
+
+    @patch("quantum_web.worker.queues.redis.pipeline")
+    def test_heartbeat(self, pipeline_mock: MagicMock):
+        self.queue.heartbeat()
+        pipe = pipeline_mock.return_value
+        pipe.set.assert_called_once_with("jobs:alive:worker-1", 1, ex=30)
+        pipe.sadd.assert_called_once_with("jobs:workers", "worker-1")
+        pipe.execute.assert_called_once()
+
+    @patch("quantum_web.worker.queues.JobQueue.move_to_queue", return_value=True)
+    @patch("quantum_web.worker.queues.redis")
+    def test_recover(self, redis_mock: MagicMock, move_mock: MagicMock):
+        redis_mock.smembers.return_value = {"worker-1", "worker-2", "worker-3"}
+        redis_mock.exists.side_effect = lambda key: key == "jobs:alive:worker-2"
+        redis_mock.lrange.return_value = ['1234', '5678', '9012']
+        # 9012 is running, left to reap
+        redis_mock.hexists.side_effect = lambda key, job_id: job_id == '9012'
+        self.assertEqual(self.queue.recover(), ['1234', '5678'])
+        redis_mock.lrange.assert_called_once_with("jobs:processing:worker-3", 0, -1)
+        move_mock.assert_called_with("jobs:processing:worker-3", '5678')
+        self.assertEqual(move_mock.call_count, 2)
+        redis_mock.srem.assert_called_once_with("jobs:workers", "worker-3")
+
+    @patch("quantum_web.worker.queues.JobQueue.move_to_queue", return_value=False)
+    @patch("quantum_web.worker.queues.redis")
+    def test_recover_concurrent(self, redis_mock: MagicMock, move_mock: MagicMock):
+        redis_mock.smembers.return_value = {"worker-3"}
+        redis_mock.exists.return_value = False
+        redis_mock.lrange.return_value = ['1234']
+        redis_mock.hexists.return_value = False
+        # another worker changed the processing list first, retried by the next sweep
+        self.assertEqual(self.queue.recover(), [])
+        redis_mock.srem.assert_not_called()
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_move_to_queue(self, redis_mock: MagicMock):
+        pipe = redis_mock.pipeline.return_value.__enter__.return_value
+        pipe.lpos.return_value = 0
+        self.assertTrue(self.queue.move_to_queue("jobs:processing:worker-3", '1234'))
+        redis_mock.pipeline.assert_called_once_with(transaction=True)
+        pipe.watch.assert_called_once_with("jobs:processing:worker-3")
+        pipe.lrem.assert_called_once_with("jobs:processing:worker-3", 1, '1234')
+        pipe.lpush.assert_called_once_with("jobs", '1234')
+        pipe.execute.assert_called_once()
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_move_to_queue_conflict(self, redis_mock: MagicMock):
+        pipe = redis_mock.pipeline.return_value.__enter__.return_value
+        pipe.lpos.return_value = 0
+        pipe.execute.side_effect = WatchError()
+        self.assertFalse(self.queue.move_to_queue("jobs:processing:worker-3", '1234'))
+        pipe.lpos.return_value = None
+        self.assertFalse(self.queue.move_to_queue("jobs:processing:worker-3", '1234'))
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_reap(self, redis_mock: MagicMock):
+        redis_mock.hgetall.return_value = {
+            "1": '{"worker": "worker-2", "pid": 1}',
+            "2": '{"worker": "worker-2", "pid": 2}',
+            "3": '{"worker": "worker-3", "pid": 3}',
+            "4": '{"worker": "worker-1", "pid": 4}',
+        }
+        alive = {"jobs:heartbeat:1", "jobs:alive:worker-2"}
+        redis_mock.exists.side_effect = lambda key: key in alive
+        redis_mock.set.return_value = True
+        reaped = self.queue.reap()
+        # job 2 is left to its live worker
+        self.assertEqual(reaped, [
+            ("3", {"worker": "worker-3", "pid": 3}), ("4", {"worker": "worker-1", "pid": 4})
+        ])
+        redis_mock.set.assert_called_with("jobs:reaping:4", "worker-1", nx=True, ex=30)
+        # claimed jobs stay registered until they are reaped
+        redis_mock.hdel.assert_not_called()
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_reap_claimed(self, redis_mock: MagicMock):
+        redis_mock.hgetall.return_value = {"1": '{"worker": "worker-1", "pid": 1}'}
+        redis_mock.exists.return_value = False
+        redis_mock.set.return_value = None
+        self.assertEqual(self.queue.reap(), [])
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_reaped(self, redis_mock: MagicMock):
+        self.queue.reaped('1234')
+        pipe = redis_mock.pipeline.return_value
+        pipe.hdel.assert_called_once_with("jobs:running", '1234')
+        pipe.delete.assert_called_once_with("jobs:reaping:1234")
+        pipe.execute.assert_called_once()
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_requeue(self, redis_mock: MagicMock):
+        redis_mock.incr.return_value = 1
+        self.assertTrue(self.queue.requeue('1234', "worker-2", max_retries=1))
+        pipe = redis_mock.pipeline.return_value
+        pipe.lrem.assert_called_once_with("jobs:processing:worker-2", 1, '1234')
+        pipe.lpush.assert_called_once_with("jobs", '1234')
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_requeue_given_up(self, redis_mock: MagicMock):
+        redis_mock.incr.return_value = 2
+        self.assertFalse(self.queue.requeue('1234', "worker-2", max_retries=1))
+        redis_mock.lrem.assert_called_once_with("jobs:processing:worker-2", 1, '1234')
+        redis_mock.lpush.assert_not_called()
+
+
+class JobHeartbeatTest(TestCase):
+    def setUp(self) -> None:
+        self.heartbeat = JobHeartbeat('1234', JobQueue("jobs", worker_id="worker-1"),
+                                      ttl=10, interval=60)
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_start_stop(self, redis_mock: MagicMock):
+        self.heartbeat.start()
+        pipe = redis_mock.pipeline.return_value
+        owner = {"worker": "worker-1", "pid": os.getpid()}
+        pipe.hset.assert_any_call("jobs:running", '1234', json.dumps(owner))
+        pipe.expire.assert_called_once_with("jobs:heartbeat:1234", 10)
+        self.heartbeat.stop()
+        self.assertIsNone(self.heartbeat.thread)
+        pipe.hdel.assert_called_once_with("jobs:running", '1234')
+        pipe.delete.assert_called_once_with("jobs:heartbeat:1234")
+
+    def test_beat(self):
+        pipe = MagicMock()
+        self.heartbeat.update(energy=-1.5)
+        self.heartbeat.update(evaluations=100)
+        self.heartbeat.beat(pipe)
+        progress = pipe.hset.call_args.kwargs["mapping"]
+        self.assertEqual(progress["evaluations"], 100)
+        self.assertEqual(progress["energy"], -1.5)
+        self.assertIn("updated", progress)
+        pipe.execute.assert_called_once()
+
+    @patch("quantum_web.worker.queues.JobHeartbeat.beat")
+    @patch("quantum_web.worker.queues.time.monotonic")
+    def test_run_stale(self, monotonic_mock: MagicMock, beat_mock: MagicMock):
+        self.heartbeat.interval = 0
+        self.heartbeat.event = MagicMock()
+        # beat while progress is updated, then the solver hangs past the ttl
+        self.heartbeat.event.wait.side_effect = [False, False, False, True]
+        monotonic_mock.side_effect = [0, 5, 5, 20, 20]
+        self.heartbeat.update(energy=-1.5)
+        with self.assertLogs("quantum_web.worker.queues", "WARNING"):
+            self.heartbeat.run()
+        self.assertEqual(beat_mock.call_count, 2)
+
+    def test_stale_without_progress_ttl(self):
+        self.heartbeat.progress_ttl = None
+        self.heartbeat.progressed = -1000
+        self.assertFalse(self.heartbeat.stale)
+
+
+class CancelSignalTest(TestCase):
+    def setUp(self) -> None:
+        self.signal = CancelSignal('1234', prefix="cancel")
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_start_not_cancelled(self, redis_mock: MagicMock):
+        redis_mock.get.return_value = None
+        self.signal.start()
+        self.assertFalse(self.signal.is_set())
+        pubsub = redis_mock.pubsub.return_value
+        pubsub.subscribe.assert_called_once_with(cancel_1234=self.signal.on_message)
+        self.signal.on_message({"data": "Example reason"})
+        self.assertTrue(self.signal.is_set())
+        self.assertEqual(self.signal.reason, "Example reason")
+        self.signal.stop()
+        pubsub.run_in_thread.return_value.stop.assert_called_once()
+
+    @patch("quantum_web.worker.queues.redis")
+    def test_start_cancelled_before(self, redis_mock: MagicMock):
+        redis_mock.get.return_value = "Example reason"
+        self.signal.start()
+        self.assertTrue(self.signal.is_set())
+        self.assertEqual(self.signal.reason, "Example reason")
@@ -0,0 +1,126 @@
+import os
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from ..scaling import ConcurrencyScaler, Slots, cpu_time, resident_memory
+
+MiB = 2 ** 20
+
+
+class SlotsTest(TestCase):
+    def test_acquire_release(self):
+        slots = Slots(2)
+        self.assertTrue(slots.acquire(timeout=0))
+        self.assertTrue(slots.acquire(timeout=0))
+        self.assertFalse(slots.acquire(timeout=0))
+        slots.release()
+        self.assertTrue(slots.acquire(timeout=0))
+        self.assertEqual(slots.busy, 2)
+
+    def test_resize(self):
+        slots = Slots(1)
+        slots.acquire()
+        slots.resize(0)
+        slots.release()
+        self.assertFalse(slots.acquire(timeout=0))
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(slots.acquire(timeout=5)))
+        thread.start()
+        slots.resize(1)
+        thread.join()
+        self.assertEqual(acquired, [True])
+
+
+class ConcurrencyScalerTest(TestCase):
+    def setUp(self) -> None:
+        self.scaler = ConcurrencyScaler(min_concurrency=1, max_concurrency=4, cpu_target=0.9,
+                                        cpu_low=0.5, min_free_memory=256 * MiB)
+        self.scaler.cpus = 4
+
+    def decide(self, queue_length, busy, utilisation=1.0, job_memory=100 * MiB,
+               free_memory=4096 * MiB):
+        return self.scaler.decide(queue_length, busy, utilisation, job_memory, free_memory)
+
+    def test_grow(self):
+        self.scaler.limit = 2
+        self.assertEqual(self.decide(queue_length=3, busy=2), (3, "jobs queued"))
+
+    def test_grow_unknown_metrics(self):
+        self.assertEqual(self.decide(queue_length=3, busy=1, utilisation=None, job_memory=None,
+                                     free_memory=None),
+                         (2, "jobs queued"))
+
+    def test_no_free_slot_needed(self):
+        self.scaler.limit = 3
+        self.assertEqual(self.decide(queue_length=3, busy=2), (3, "steady load"))
+
+    def test_maximum(self):
+        self.scaler.limit = 4
+        self.assertEqual(self.decide(queue_length=3, busy=4),
+                         (4, "maximum concurrency reached"))
+
+    def test_no_cpu_headroom(self):
+        self.scaler.limit = 3
+        self.assertEqual(self.decide(queue_length=3, busy=3, utilisation=0.95),
+                         (3, "no CPU headroom"))
+
+    def test_no_memory_headroom(self):
+        self.scaler.limit = 2
+        self.assertEqual(self.decide(queue_length=3, busy=2, job_memory=300 * MiB,
+                                     free_memory=500 * MiB),
+                         (2, "no memory headroom"))
+
+    def test_low_memory(self):
+        self.scaler.limit = 3
+        self.assertEqual(self.decide(queue_length=3, busy=3, free_memory=100 * MiB),
+                         (2, "low memory"))
+
+    def test_cpu_contention(self):
+        self.scaler.limit = 4
+        self.assertEqual(self.decide(queue_length=3, busy=4, utilisation=0.3),
+                         (3, "CPU contention"))
+
+    def test_idle(self):
+        self.scaler.limit = 3
+        self.assertEqual(self.decide(queue_length=0, busy=1), (2, "idle slots"))
+        self.scaler.limit = 1
+        self.assertEqual(self.decide(queue_length=0, busy=0), (1, "idle slots"))
+
+    @patch("quantum_web.worker.scaling.available_memory", return_value=4096 * MiB)
+    @patch("quantum_web.worker.scaling.resident_memory", return_value=100 * MiB)
+    @patch("quantum_web.worker.scaling.cpu_time", side_effect=[10.0, 12.0])
+    @patch("quantum_web.worker.scaling.time.monotonic", side_effect=[100.0, 102.0])
+    @patch("quantum_web.worker.scaling.active_children", return_value=[MagicMock(pid=1234)])
+    def test_update(self, children_mock: MagicMock, monotonic_mock: MagicMock,
+                    cpu_time_mock: MagicMock, memory_mock: MagicMock, available_mock: MagicMock):
+        # no CPU utilisation known after the first sample
+        with self.assertLogs("quantum_web.worker.scaling", "INFO") as logs:
+            self.assertEqual(self.scaler.update(queue_length=2, busy=1), 2)
+        self.assertIn("Concurrency 1 -> 2: jobs queued", logs.output[0])
+        self.assertEqual(self.scaler.sample(busy=1), (1.0, 100 * MiB))
+
+    @patch("quantum_web.worker.scaling.resident_memory", return_value=100 * MiB)
+    @patch("quantum_web.worker.scaling.time.monotonic", side_effect=[100.0, 102.0])
+    @patch("quantum_web.worker.scaling.active_children")
+    def test_sample_running_subprocesses(self, children_mock: MagicMock,
+                                         monotonic_mock: MagicMock, memory_mock: MagicMock):
+        # pid 2 is idle and the last subprocess is not started yet, only pid 1 ran a job
+        children_mock.return_value = [MagicMock(pid=1), MagicMock(pid=2), MagicMock(pid=None)]
+        cpu_times = {1: [10.0, 11.5], 2: [5.0, 5.0]}
+        with patch("quantum_web.worker.scaling.cpu_time",
+                   side_effect=lambda pid: cpu_times[pid].pop(0)):
+            self.scaler.sample(busy=2)
+            self.assertEqual(self.scaler.sample(busy=2), (0.75, 100 * MiB))
+
+
+class ProcessMetricsTest(TestCase):
+    def test_current_process(self):
+        if not os.path.exists(f"/proc/{os.getpid()}/stat"):
+            self.skipTest("procfs is not available")
+        self.assertGreater(cpu_time(os.getpid()), 0)
+        self.assertGreater(resident_memory(os.getpid()), 0)
+
+    def test_unknown_process(self):
+        self.assertIsNone(cpu_time(-1))
+        self.assertIsNone(resident_memory(-1))
@@ -1,7 +1,14 @@
 from unittest import TestCase
-from unittest.mock import MagicMock, patch
+from unittest.mock import DEFAULT, MagicMock, patch
 
-from sdk_mock.qboard.constants import CB_TYPE_NEW_SOLUTION
+from django.conf import settings
+from django.test import override_settings
+
+from sdk_mock.qboard.constants import (
+    CB_TYPE_INTERRUPT_CANCEL,
+    CB_TYPE_INTERRUPT_INTERVAL,
+    CB_TYPE_NEW_SOLUTION,
+)
 
 from ..worker import QuantumWorker
 
@@ -15,10 +22,25 @@ class WorkerTest(TestCase):
 
     def setUp(self) -> None:
         self.worker = QuantumWorker(self.job_id)
+        patcher = patch.multiple(
+            "quantum_web.worker.worker.CancelSignal", start=DEFAULT, stop=DEFAULT
+        )
+        self.cancel_mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.multiple(
+            "quantum_web.worker.worker.ResultPublisher", start=DEFAULT, close=DEFAULT
+        )
+        self.publisher_mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.multiple(
+            "quantum_web.worker.worker.JobHeartbeat", start=DEFAULT, stop=DEFAULT
+        )
+        self.heartbeat_mocks = patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch("qboard.solver.solver.solve_qubo")
-    @patch("quantum_web.worker.worker.ResultQueue.put_start")
-    @patch("quantum_web.worker.worker.ResultQueue.put_stop")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_start")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
     def test_run(
         self,
         solve_mock: MagicMock,
@@ -31,8 +53,8 @@ class WorkerTest(TestCase):
         put_stop_mock.assert_called_once()
 
     @patch("qboard.solver.solver.solve_qubo", side_effect=TestException())
-    @patch("quantum_web.worker.worker.ResultQueue.put_start")
-    @patch("quantum_web.worker.worker.ResultQueue.put_stop")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_start")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
     def test_run_exception(
         self,
         solve_mock: MagicMock,
@@ -44,13 +66,76 @@ class WorkerTest(TestCase):
         solve_mock.assert_called_once()
         put_stop_mock.assert_called_once()
 
-    @patch("quantum_web.worker.worker.ResultQueue.put_solution")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_solution")
     def test_solver_callback(self, put_solution_mock):
         self.worker.solver_callback({
             "cb_type": CB_TYPE_NEW_SOLUTION,
             "energy": -12.323
         })
 
+    @patch("qboard.solver.solver.solve_qubo")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_start")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
+    def test_run_cancel_token(self, put_stop_mock, put_start_mock, solve_mock):
+        self.worker.run()
+        self.assertIs(solve_mock.call_args.kwargs["cancel"], self.worker.cancel)
+        self.cancel_mocks["start"].assert_called_once()
+        self.cancel_mocks["stop"].assert_called_once()
+
+    @patch("qboard.solver.solver.solve_qubo")
+    def test_run_stop_sent_once(self, solve_mock):
+        def solve(*args, **kwargs):
+            kwargs["callback"]({"cb_type": CB_TYPE_INTERRUPT_CANCEL})
+
+        solve_mock.side_effect = solve
+        self.worker.run()
+        self.assertEqual([e[0].value for e in self.worker.result.events], ["start"])
+        self.assertEqual(self.worker.result.stop_reason, "Solver cancelled")
+
+    @patch("qboard.solver.solver.solve_qubo")
+    def test_run_heartbeat(self, solve_mock):
+        self.worker.run()
+        self.heartbeat_mocks["start"].assert_called_once()
+        self.heartbeat_mocks["stop"].assert_called_once()
+
+    @patch("quantum_web.worker.worker.ResultPublisher.put_solution")
+    def test_heartbeat_progress(self, put_solution_mock: MagicMock):
+        for cb_type, evaluations in [(CB_TYPE_NEW_SOLUTION, 10), (CB_TYPE_INTERRUPT_INTERVAL, 20)]:
+            self.worker.solver_callback(
+                {"cb_type": cb_type, "energy": -1.5, "evaluations": evaluations}
+            )
+        self.assertEqual(self.worker.heartbeat.evaluations, 20)
+        self.assertEqual(self.worker.heartbeat.energy, -1.5)
+
+    def test_heartbeat_progress_ttl(self):
+        self.assertEqual(self.worker.heartbeat.progress_ttl, settings.JOB_HEARTBEAT_TTL)
+        # without interval callbacks progress isn't reported regularly
+        with override_settings(WORKER_CALLBACK_INTERVAL=0):
+            self.assertIsNone(QuantumWorker(self.job_id).heartbeat.progress_ttl)
+
+    @patch("qboard.solver.solver.solve_qubo")
+    def test_run_publisher(self, solve_mock):
+        self.worker.run()
+        self.publisher_mocks["start"].assert_called_once()
+        self.publisher_mocks["close"].assert_called_once_with(settings.RESULT_PUBLISH_TIMEOUT)
+        self.assertEqual(self.worker.result.stop_reason, "")
+
+    @override_settings(WORKER_CALLBACK_INTERVAL=0.5)
+    @patch("qboard.solver.solver.solve_qubo")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_start")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
+    def test_run_callback_interval(self, put_stop_mock, put_start_mock, solve_mock):
+        self.worker.run()
+        self.assertEqual(solve_mock.call_args.kwargs["interval"], 0.5)
+
+    @patch("quantum_web.worker.worker.ResultPublisher.put_solution")
+    def test_solver_callback_interval(self, put_solution_mock: MagicMock):
+        self.worker.solver_callback({
+            "cb_type": CB_TYPE_INTERRUPT_INTERVAL,
+            "energy": -12.323
+        })
+        put_solution_mock.assert_not_called()
+
     def test_solver_callback_no_cb_type(self):
         with self.assertRaises(RuntimeError):
             self.worker.solver_callback({})
@@ -58,23 +143,29 @@ class WorkerTest(TestCase):
     def test_solver_callback_invalid_type(self):
         self.worker.solver_callback({"cb_type": 999})
 
-    @patch("quantum_web.worker.worker.ResultQueue.put_solution")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_solution")
     def test_on_new_solution(self, put_solution_mock: MagicMock):
         energy = -2.32
         self.worker.on_new_solution({"energy": energy})
         put_solution_mock.assert_called_once_with(energy)
 
-    @patch("quantum_web.worker.worker.ResultQueue.put_solution")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_solution")
     def test_on_new_solution_without_energy(self, put_solution_mock: MagicMock):
         self.worker.on_new_solution({})
         put_solution_mock.assert_not_called()
 
-    @patch("quantum_web.worker.worker.ResultQueue.put_stop")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
     def test_on_interrupt_timeout(self, put_stop_mock: MagicMock):
         self.worker.on_interrupt_timeout({})
         put_stop_mock.assert_called_once_with("Solver interrupted by timeout")
 
-    @patch("quantum_web.worker.worker.ResultQueue.put_stop")
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
     def test_on_interrupt_target(self, put_stop_mock: MagicMock):
         self.worker.on_interrupt_target({})
         put_stop_mock.assert_called_once_with("Solver interrupted by target")
+
+    @patch("quantum_web.worker.worker.ResultPublisher.put_stop")
+    def test_on_interrupt_cancel(self, put_stop_mock: MagicMock):
+        self.worker.cancel.set("Cancelled by user")
+        self.worker.solver_callback({"cb_type": CB_TYPE_INTERRUPT_CANCEL})
+        put_stop_mock.assert_called_once_with("Solver cancelled: Cancelled by user")
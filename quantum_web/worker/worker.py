@@ -2,10 +2,19 @@ import logging
 from typing import Callable
 
 import numpy as np
-
-from quantum_web.worker.queues import ResultQueue
+from django.conf import settings
+
+from quantum_web.worker.queues import (
+    CancelSignal,
+    JobHeartbeat,
+    JobQueue,
+    ResultPublisher,
+    ResultQueue,
+)
 from sdk_mock import qboard
-from sdk_mock.qboard.constants import (  # TODO: interval, new_loss?
+from sdk_mock.qboard.constants import (  # TODO: new_loss?
+    CB_TYPE_INTERRUPT_CANCEL,
+    CB_TYPE_INTERRUPT_INTERVAL,
     CB_TYPE_INTERRUPT_TARGET,
     CB_TYPE_INTERRUPT_TIMEOUT,
     CB_TYPE_NEW_SOLUTION,
@@ -21,9 +30,16 @@ class QuantumWorker:
 
     Generate random sample and run solver.
     """
-    def __init__(self, job_id: str):
+    def __init__(self, job_id: str, worker_id: str | None = None):
         self.job_id = job_id
-        self.result = ResultQueue(job_id)
+        # solutions are published from a background thread, solver never waits on redis
+        self.result = ResultPublisher(ResultQueue(job_id))
+        self.cancel = CancelSignal(job_id)
+        # interval callbacks report progress, without them the solver can be silent for long
+        self.heartbeat = JobHeartbeat(
+            job_id, JobQueue(worker_id=worker_id),
+            progress_ttl=settings.JOB_HEARTBEAT_TTL if settings.WORKER_CALLBACK_INTERVAL else None,
+        )
 
     def run(self):
         """Handle computation job.
@@ -33,21 +49,31 @@ class QuantumWorker:
         stop_message = ""
 
         log.info("Job started (job_id=%s)", self.job_id)
+        self.heartbeat.start()
+        self.result.start()
         self.result.put_start()
 
         try:
-            solver = qboard.solver(mode="bf")
+            self.cancel.start()
+            solver = qboard.solver(mode="bf", params={"traversal": "gray"})
             solver.solve_qubo(
                 self.generate_sample(),
                 callback=self.solver_callback,
                 timeout=30,
-                verbosity=0
+                verbosity=0,
+                interval=settings.WORKER_CALLBACK_INTERVAL or None,
+                cancel=self.cancel,
             )
         except Exception as e:  # noqa
             log.exception("Solver raised an unhandled exception.")
             stop_message = "Solver raised an unhandled exception: %s" % e
         finally:
-            self.result.put_stop(stop_message)
+            self.cancel.stop()
+            # interruption callbacks already sent STOP with their reason
+            if not self.result.stopped:
+                self.result.put_stop(stop_message)
+            self.result.close(settings.RESULT_PUBLISH_TIMEOUT)
+            self.heartbeat.stop()
             log.info("Job stopped (job_id: %s).", self.job_id)
 
     def solver_callback(self, payload: dict):
@@ -64,6 +90,8 @@ class QuantumWorker:
             CB_TYPE_NEW_SOLUTION: self.on_new_solution,
             CB_TYPE_INTERRUPT_TIMEOUT: self.on_interrupt_timeout,
             CB_TYPE_INTERRUPT_TARGET: self.on_interrupt_target,
+            CB_TYPE_INTERRUPT_INTERVAL: self.on_interval,
+            CB_TYPE_INTERRUPT_CANCEL: self.on_interrupt_cancel,
         }.get(int(cb_type))
         if callback is not None:
             return callback(payload)
@@ -77,8 +105,19 @@ class QuantumWorker:
             return
         energy = payload["energy"]
         log.debug("New solution found, energy %f", energy)
+        self.heartbeat.update(payload.get("evaluations"), energy)
         self.result.put_solution(energy)
 
+    def on_interval(self, payload: dict):
+        """Handle periodic heartbeat of the solver.
+
+        New solutions are coalesced by the solver and delivered before the heartbeat,
+        so only job progress is updated here.
+        """
+        log.debug("Solver heartbeat, best energy %s (job_id=%s)",
+                  payload.get("energy"), self.job_id)
+        self.heartbeat.update(payload.get("evaluations"), payload.get("energy"))
+
     def on_interrupt_timeout(self, payload: dict):
         """Handle interrupt event caused by specified solver timeout."""
         msg = "Solver interrupted by timeout"
@@ -94,6 +133,14 @@ class QuantumWorker:
         log.info("%s (job_id=%s)", msg, self.job_id)
         self.result.put_stop(msg)
 
+    def on_interrupt_cancel(self, payload: dict):
+        """Handle interruption event caused by job cancellation."""
+        msg = "Solver cancelled"
+        if self.cancel.reason:
+            msg = "%s: %s" % (msg, self.cancel.reason)
+        log.info("%s (job_id=%s)", msg, self.job_id)
+        self.result.put_stop(msg)
+
     @staticmethod
     def generate_sample():
         """Generate random sample for solver."""
@@ -0,0 +1,54 @@
+"""Compare two benchmark result files.
+
+Prints the change of wall time and peak memory of every case present in both files and
+exits with status 1 if any case got slower (or bigger) than the threshold allows.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.2
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return {r["case"]: r for r in json.load(f)["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative increase of time and memory")
+    parser.add_argument("--metric", action="append", default=None,
+                        help="metrics to compare (default: time, peak_memory)")
+    args = parser.parse_args()
+    metrics = args.metric or ["time", "peak_memory"]
+
+    before, after = load(args.before), load(args.after)
+    regressions = []
+    for case in sorted(before.keys() & after.keys()):
+        changes = []
+        for metric in metrics:
+            old, new = before[case].get(metric), after[case].get(metric)
+            if not old or new is None:
+                changes.append("%s n/a" % metric)
+                continue
+            change = new / old - 1
+            changes.append("%s %+.1f%%" % (metric, 100 * change))
+            if change > args.threshold:
+                regressions.append((case, metric, change))
+        print("%-22s %s" % (case, "  ".join(changes)))
+    for case in sorted(before.keys() ^ after.keys()):
+        print("%-22s only in %s" % (case, args.before if case in before else args.after))
+
+    if regressions:
+        print("\nRegressions over %.0f%%:" % (100 * args.threshold))
+        for case, metric, change in regressions:
+            print("  %s %s %+.1f%%" % (case, metric, 100 * change))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
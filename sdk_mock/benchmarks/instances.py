@@ -0,0 +1,21 @@
+"""Reproducible benchmark problems"""
+import zlib
+
+import numpy as np
+import scipy.sparse
+
+
+def seed(name):
+    """Stable seed derived from a case name"""
+    return zlib.crc32(name.encode())
+
+
+def random_qubo(size, density=1.0, sparse=False, seed=0):
+    """Random problem with uniform coefficients in [-0.5, 0.5) on `density` of the entries"""
+    rng = np.random.default_rng(seed)
+    if density < 1.0:
+        Q = scipy.sparse.random(size, size, density=density, random_state=rng, format="csr",
+                                data_rvs=lambda k: rng.random(k) - 0.5)
+        return Q if sparse else Q.toarray()
+    Q = rng.random((size, size)) - 0.5
+    return scipy.sparse.csr_matrix(Q) if sparse else Q
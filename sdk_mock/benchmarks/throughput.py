@@ -0,0 +1,162 @@
+"""Solver throughput benchmarks.
+
+Runs every mode of qboard.solver on fixed-seed problems of several sizes, dense and sparse,
+and writes wall time, evaluations per second, time to the best solution and peak memory
+as JSON, to be compared across commits with `benchmarks.compare`.
+
+    cd sdk_mock
+    python -m benchmarks.throughput --output before.json
+    python -m benchmarks.throughput --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+import qboard
+from qboard.constants import CB_TYPE_NEW_SOLUTION
+from benchmarks.instances import random_qubo, seed
+
+# Explicit mode params, evaluations are counted from them
+MODES = {
+    "bf-block": ("bf", {"traversal": "block"}),
+    "bf-gray": ("bf", {"traversal": "gray"}),
+    "bb": ("bb", {}),
+    "sa": ("sa", {"replicas": 64, "sweeps": 200, "seed": 1}),
+    "pt": ("pt", {"temperatures": 32, "sweeps": 200, "seed": 1}),
+    "tabu": ("tabu", {"restarts": 16, "iterations": 2000, "seed": 1}),
+    "simcim": ("simcim", {"trajectories": 64, "steps": 1000, "seed": 1}),
+}
+EXACT_SIZES = (10, 15, 20, 25, 30)
+HEURISTIC_SIZES = (64, 256, 1024)
+# density of the sparse variant of heuristic problems
+SPARSE_DENSITY = 0.02
+
+
+def evaluations(name, size):
+    """Number of candidate evaluations (energies or one-flip moves) of a full run"""
+    params = MODES[name][1]
+    if name.startswith("bf"):
+        return 2 ** size
+    elif name == "sa":
+        return params["replicas"] * params["sweeps"] * size
+    elif name == "pt":
+        return params["temperatures"] * params["sweeps"] * size
+    elif name == "tabu":
+        return params["restarts"] * params["iterations"] * size
+    elif name == "simcim":
+        return params["trajectories"] * params["steps"]
+    # branch and bound visits a problem dependent number of nodes
+    return None
+
+
+def cases(quick=False):
+    exact_sizes = [n for n in EXACT_SIZES if not quick or n <= 20]
+    heuristic_sizes = [n for n in HEURISTIC_SIZES if not quick or n <= 256]
+    for name in MODES:
+        if name.startswith("bf") or name == "bb":
+            for size in exact_sizes:
+                yield name, size, "dense"
+        else:
+            for size in heuristic_sizes:
+                yield name, size, "dense"
+                yield name, size, "sparse"
+
+
+def run_case(name, size, kind, repeat):
+    mode, params = MODES[name]
+    case = "%s/%s/%i" % (name, kind, size)
+    if kind == "sparse":
+        Q = random_qubo(size, SPARSE_DENSITY, sparse=True, seed=seed(case))
+    else:
+        Q = random_qubo(size, seed=seed(case))
+    solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+
+    def solve():
+        found = []
+        start = time.perf_counter()
+
+        def callback(payload):
+            if payload["cb_type"] == CB_TYPE_NEW_SOLUTION:
+                found.append((time.perf_counter() - start, payload["energy"]))
+
+        spins, energy = solver.solve_qubo(Q, callback=callback)
+        elapsed = time.perf_counter() - start
+        # the first report of the final energy
+        time_to_best = min((t for t, e in found if e <= energy), default=elapsed)
+        return elapsed, time_to_best, float(energy)
+
+    # warm-up run, also measures peak memory of numpy and python allocations
+    tracemalloc.start()
+    solve()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    runs = [solve() for _ in range(repeat)]
+    elapsed = statistics.median(r[0] for r in runs)
+    count = evaluations(name, size)
+    return {
+        "case": case,
+        "mode": mode,
+        "params": params,
+        "size": size,
+        "format": kind,
+        "time": elapsed,
+        "times": [r[0] for r in runs],
+        "time_to_best": statistics.median(r[1] for r in runs),
+        "energy": runs[0][2],
+        "evaluations": count,
+        "evaluations_per_second": count / elapsed if count is not None else None,
+        "peak_memory": peak_memory,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="throughput.json", help="result file")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="only small problem sizes")
+    parser.add_argument("--mode", action="append", choices=sorted(MODES), help="run only these modes")
+    args = parser.parse_args()
+
+    results = []
+    for name, size, kind in cases(args.quick):
+        if args.mode and name not in args.mode:
+            continue
+        result = run_case(name, size, kind, args.repeat)
+        results.append(result)
+        print("%-22s %9.4fs  to best %9.4fs  %12s eval/s  %8.1f MiB" % (
+            result["case"], result["time"], result["time_to_best"],
+            "-" if result["evaluations_per_second"] is None else "%.3g" % result["evaluations_per_second"],
+            result["peak_memory"] / 2 ** 20,
+        ), flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Time-to-target benchmark of heuristic solver modes.
+
+Every configuration (mode and params) is run several times with different seeds on a fixed
+library of instances whose optima are found once by the exact `bb` mode and kept in the
+qboard result cache on disk. The callback stream of every run is recorded to get the time
+each target energy (the optimum and optimum plus a relative gap) was first reached. Per
+configuration, instance and target the success probability within the time budget,
+time-to-target percentiles and the time to solution with 99% confidence are reported.
+
+    cd sdk_mock
+    python -m benchmarks.time_to_target --runs 20 --budget 5 --output ttt.json
+    python -m benchmarks.time_to_target --config 'sa:{"sweeps": 300}' --config 'tabu:{}'
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import qboard
+from qboard.constants import CB_TYPE_NEW_SOLUTION
+from benchmarks.instances import random_qubo, seed
+
+# name: (size, density, sparse)
+INSTANCES = {
+    "dense-20": (20, 1.0, False),
+    "dense-24": (24, 1.0, False),
+    "dense-28": (28, 1.0, False),
+    "dense-32": (32, 1.0, False),
+    "sparse-32": (32, 0.2, True),
+    "sparse-36": (36, 0.15, True),
+}
+CONFIGS = ["sa:{}", "pt:{}", "tabu:{}", "simcim:{}"]
+# relative gaps to the optimum used as targets
+GAPS = (0.0, 0.01)
+PERCENTILES = (50, 90)
+OPTIMA_DIR = os.path.join(os.path.dirname(__file__), ".optima")
+
+
+def instance(name):
+    size, density, sparse = INSTANCES[name]
+    return random_qubo(size, density, sparse=sparse, seed=seed(name))
+
+
+def optimum(Q, cache_dir=OPTIMA_DIR):
+    """Exact optimum, solved by branch and bound once and then taken from the disk cache"""
+    solver = qboard.solver(mode="bb", verbosity=0, cache_dir=cache_dir)
+    return float(solver.solve_qubo(Q, enable_cache=True)[1])
+
+
+def target(energy, gap):
+    # energies are negative for these instances, a gap moves the target towards zero
+    return energy + gap * abs(energy) + 1e-9 * max(1.0, abs(energy))
+
+
+def run(mode, params, Q, best, budget, run_seed):
+    """Solve once, return the (time, energy) stream of improvements and the run time"""
+    stream = []
+    start = time.perf_counter()
+
+    def callback(payload):
+        if payload["cb_type"] == CB_TYPE_NEW_SOLUTION:
+            stream.append((time.perf_counter() - start, float(payload["energy"])))
+
+    solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=dict(params, seed=run_seed))
+    # stop as soon as the strictest target is reached
+    solver.solve_qubo(Q, timeout=budget, target=target(best, 0.0), callback=callback)
+    return stream, time.perf_counter() - start
+
+
+def summarize(streams, durations, level, budget, percentiles):
+    """Success probability, time-to-target percentiles and TTS99 for one target level.
+
+    TTS99 is the expected time of independent runs until the target is reached with 99%
+    confidence, runs that finish early (e.g. fixed number of sweeps) are cheaper than budget.
+    """
+    times = sorted(
+        next((t for t, e in stream if e <= level), math.inf) for stream in streams
+    )
+    successes = sum(t <= budget for t in times)
+    probability = successes / len(times)
+    summary = {"success_probability": probability}
+    for q in percentiles:
+        # nearest-rank percentile over all runs, unreached targets count as infinite time
+        t = times[max(math.ceil(q / 100 * len(times)) - 1, 0)]
+        summary["ttt_p%i" % q] = t if t <= budget else None
+    if probability == 1:
+        summary["tts99"] = times[-1]
+    elif probability > 0:
+        summary["tts99"] = float(np.mean(durations)) * math.log(0.01) / math.log(1 - probability)
+    else:
+        summary["tts99"] = None
+    return summary
+
+
+def parse_config(config):
+    mode, _, params = config.partition(":")
+    return mode, json.loads(params or "{}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", action="append", help="mode:json params, e.g. 'sa:{\"sweeps\": 300}'")
+    parser.add_argument("--instance", action="append", choices=sorted(INSTANCES), help="run only these instances")
+    parser.add_argument("--runs", type=int, default=10, help="runs (seeds) per configuration and instance")
+    parser.add_argument("--budget", type=float, default=5.0, help="time budget of a run, seconds")
+    parser.add_argument("--gap", type=float, action="append", help="relative gaps to the optimum used as targets")
+    parser.add_argument("--percentile", type=int, action="append", help="time-to-target percentiles")
+    parser.add_argument("--output", default="ttt.json", help="result file")
+    args = parser.parse_args()
+    gaps = args.gap or GAPS
+    percentiles = args.percentile or PERCENTILES
+
+    results = []
+    for name in args.instance or INSTANCES:
+        Q = instance(name)
+        best = optimum(Q)
+        print("%s: optimum %f" % (name, best), flush=True)
+        for config in args.config or CONFIGS:
+            mode, params = parse_config(config)
+            streams, durations = zip(*(run(mode, params, Q, best, args.budget, run_seed) for run_seed in range(args.runs)))
+            finals = [stream[-1][1] if stream else math.inf for stream in streams]
+            result = {
+                "instance": name,
+                "config": config,
+                "optimum": best,
+                "runs": args.runs,
+                "budget": args.budget,
+                "mean_final_gap": float(np.mean([(e - best) / abs(best) for e in finals])),
+                "targets": {},
+                "durations": durations,
+                "streams": streams,
+            }
+            for gap in gaps:
+                summary = summarize(streams, durations, target(best, gap), args.budget, percentiles)
+                result["targets"]["%g" % gap] = summary
+                print("  %-28s gap %-5g p_success %5.2f  %s  tts99 %s" % (
+                    config, gap, summary["success_probability"],
+                    "  ".join("p%i %s" % (q, fmt(summary["ttt_p%i" % q])) for q in percentiles),
+                    fmt(summary["tts99"]),
+                ), flush=True)
+            results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump({"gaps": list(gaps), "percentiles": list(percentiles), "results": results}, f, indent=2)
+
+
+def fmt(seconds):
+    return "-" if seconds is None else "%.4fs" % seconds
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+
+def key(basis, mode, mparams, target, *arrays):
+    """Content address of a problem: hash of matrices bytes, shapes and dtypes plus solver
+    mode and parameters which affect the result"""
+    digest = hashlib.sha256()
+    digest.update(repr((basis, mode, sorted(mparams.items()), target)).encode())
+    for a in arrays:
+        if scipy.sparse.issparse(a):
+            a = scipy.sparse.csr_matrix(a)
+            a.sum_duplicates()
+            digest.update(repr(("csr", a.shape)).encode())
+            arrays_of_a = (a.data, a.indices, a.indptr)
+        else:
+            arrays_of_a = (a,)
+        for a in arrays_of_a:
+            a = np.ascontiguousarray(a)
+            digest.update(repr((a.shape, a.dtype.str)).encode())
+            digest.update(a.data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Solver result cache.
+
+    Results are kept in a bounded in-memory LRU and, if `directory` is given, also stored on
+    disk (one .npz file per key) so they survive the process and can be shared between
+    processes.
+    """
+
+    def __init__(self, max_entries=128, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """Return (spins, energy) stored for key or None. Spins are a copy, so callers may
+        modify them"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            spins, energy = self.entries[key]
+            return spins.copy(), energy
+        if self.directory is None:
+            return None
+        try:
+            with np.load(self.path(key)) as data:
+                result = data["spins"], data["energy"][()]
+        except (OSError, KeyError, ValueError):
+            return None
+        self.remember(key, result)
+        return result[0].copy(), result[1]
+
+    def put(self, key, spins, energy):
+        # own copy, the caller keeps using its spins
+        result = np.array(spins), energy
+        self.remember(key, result)
+        if self.directory is None:
+            return
+        # write to a temporary file first so concurrent readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                np.savez(fp, spins=result[0], energy=energy)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+
+_caches = {}
+
+
+def get_cache(directory=None):
+    """Cache shared by all solvers of the process using the same directory"""
+    if directory not in _caches:
+        _caches[directory] = ResultCache(directory=directory)
+    return _caches[directory]
@@ -3,6 +3,7 @@ CB_TYPE_NEW_LOSS = 1
 CB_TYPE_INTERRUPT_TIMEOUT = 10
 CB_TYPE_INTERRUPT_TARGET = 11
 CB_TYPE_INTERRUPT_INTERVAL = 12
+CB_TYPE_INTERRUPT_CANCEL = 13
 
 LOSS_FN_MIN = 0
 LOSS_FN_MEAN = 2
\ No newline at end of file
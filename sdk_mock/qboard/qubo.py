@@ -1,12 +1,185 @@
 #!/usr/bin/env python
-import scipy.linalg
+import itertools
+import struct
+
+import scipy.sparse
 import numpy as np
 
 def energy_qubo(Q, spins_qubo):
-    return spins_qubo @ Q @ spins_qubo
+    if isinstance(Q, np.ndarray) and Q.dtype == np.float32:
+        # sum the selected rows in double precision instead of upcasting the whole matrix
+        selected = np.asarray(spins_qubo) != 0
+        return Q[selected].sum(axis=0, dtype=float) @ spins_qubo
+    return spins_qubo @ (Q @ spins_qubo)
 
 def energy_ising(h, J, spins_ising):
-    return h @ spins_ising + spins_ising @ J @ spins_ising
+    return h @ spins_ising + spins_ising @ (J @ spins_ising)
+
+
+def asmatrix(Q, dtype=float):
+    """Problem matrix as ndarray or, for sparse input, as CSR matrix"""
+    if scipy.sparse.issparse(Q):
+        return scipy.sparse.csr_matrix(Q, dtype=dtype)
+    return np.asarray(Q, dtype=dtype)
+
+
+def dense(Q, dtype=float):
+    """Problem matrix as dense ndarray"""
+    if scipy.sparse.issparse(Q):
+        return Q.toarray().astype(dtype, copy=False)
+    return np.asarray(Q, dtype=dtype)
+
+
+def couplings(Q):
+    """Symmetric coupling matrix W = Q + Q^T with zero diagonal and the diagonal of Q.
+
+    W is CSR for sparse Q, so flip updates cost the number of nonzeros of a row.
+    """
+    diag = np.asarray(Q.diagonal(), dtype=float).copy()
+    if scipy.sparse.issparse(Q):
+        W = (Q + Q.T).tolil()
+        W.setdiag(0)
+        W = W.tocsr()
+        W.eliminate_zeros()
+        return W, diag
+    W = Q + Q.T
+    np.fill_diagonal(W, 0)
+    return W, diag
+
+
+def compact(Q, dtype=np.float32):
+    """Upper-triangular matrix with the same energies (off-diagonal pairs folded above the
+    diagonal) in reduced precision, sparse input keeps half of the symmetric nonzeros
+
+    >>> compact(np.array([[1, 2], [3, 4]]))
+    array([[1., 5.],
+           [0., 4.]], dtype=float32)
+    """
+    if scipy.sparse.issparse(Q):
+        Q = scipy.sparse.csr_matrix(Q, dtype=dtype)
+        return (scipy.sparse.triu(Q + Q.T, k=1) + scipy.sparse.diags(Q.diagonal())).tocsr()
+    Q = np.asarray(Q, dtype=dtype)
+    U = np.triu(Q + Q.T, 1)
+    np.fill_diagonal(U, Q.diagonal())
+    return U
+
+
+def shift(Q):
+    """Constant between qubo and ising energies of the same problem"""
+    return (Q.sum() + Q.diagonal().sum()) / 4
+
+
+def pack_spins(spins):
+    """Pack rows of binary (or ising, -1 is packed as 0) spins to uint8, bit j % 8 of byte
+    j // 8 holds variable j"""
+    return np.packbits(np.asarray(spins) > 0, axis=-1, bitorder="little")
+
+
+def unpack_spins(packed, size):
+    """Unpack rows packed by `pack_spins` (uint8) or the same bit layout in uint64 words"""
+    packed = np.asarray(packed)
+    if packed.dtype != np.uint8:
+        packed = packed.astype("<u8", copy=False).view(np.uint8)
+    return np.unpackbits(packed, axis=-1, count=size, bitorder="little")
+
+
+def _matrix(Q):
+    # nested lists are accepted like by the solvers, arrays keep their dtype
+    return Q if scipy.sparse.issparse(Q) else np.asarray(Q)
+
+
+def _spins_matrix(spins, size, packed):
+    if packed:
+        spins = unpack_spins(spins, size)
+    return np.asarray(spins)
+
+
+def _quadratic_batch(A, S):
+    """Row-wise s @ A @ s for every row s of S with one matrix product.
+
+    An integer matrix is cast to float, never the spin stack.
+    """
+    if A.dtype.kind not in "fc":
+        A = A.astype(float) if scipy.sparse.issparse(A) else np.asarray(A, dtype=float)
+    return np.einsum("ij,ij->i", np.asarray(S @ A), S)
+
+
+def _line_sums(A):
+    """Sums of rows plus sums of columns of A"""
+    return np.asarray(A.sum(axis=1)).ravel() + np.asarray(A.sum(axis=0)).ravel()
+
+
+def energy_qubo_batch(Q, spins_qubo, packed=False):
+    """Energies of every row of a (k x n) matrix of binary spins.
+
+    >>> energy_qubo_batch(np.array([[2, 2], [3, 6]]), [[1, 0], [1, 1], [0, 0]])
+    array([ 2., 13.,  0.])
+    >>> energy_qubo_batch(np.array([[2, 2], [3, 6]]), pack_spins([[1, 0], [1, 1]]), packed=True)
+    array([ 2., 13.])
+    >>> energy_qubo_batch([[2, 2], [3, 6]], [[1, 1]])
+    array([13.])
+    """
+    Q = _matrix(Q)
+    S = _spins_matrix(spins_qubo, Q.shape[0], packed)
+    return _quadratic_batch(Q, S)
+
+
+def energy_ising_batch(h, J, spins_ising):
+    """Energies of every row of a (k x n) matrix of ising (-1, 1) spins"""
+    S = np.asarray(spins_ising)
+    return _quadratic_batch(_matrix(J), S) + S @ np.asarray(h)
+
+
+def energy_batch(Q, spins, packed=False):
+    """Batched `energy`: every row holds binary or ising spins.
+
+    Rows are scored as they are, ising rows (with -1 spins) are mapped to binary spins
+    x = (s + 1) / 2 in the energy terms instead of rewriting the spins.
+
+    >>> Q = np.array([[2, 2], [3, 6]])
+    >>> S = np.array([[1, 0], [1, -1], [-1, -1], [1, 1]])
+    >>> bool(np.allclose(energy_batch(Q, S), [energy(Q, s) for s in S]))
+    True
+    """
+    Q = _matrix(Q)
+    S = _spins_matrix(spins, Q.shape[0], packed)
+    energies = _quadratic_batch(Q, S)
+    ising = S.min(axis=1, initial=0) < 0
+    if ising.any():
+        # x Q x = (s Q s + s (Q + Q^T) 1 + 1 Q 1) / 4
+        mapped = (energies + S @ _line_sums(Q) + Q.sum()) / 4
+        energies = np.where(ising, mapped, energies)
+    return energies
+
+
+def ienergy_batch(h, J, spins, packed=False):
+    """Batched `ienergy`: every row holds binary or ising spins.
+
+    Rows are scored with h and J as they are, binary rows are mapped to ising spins
+    s = 2 x - 1 in the energy terms, so 0 spins are never rewritten to -1.
+
+    >>> h = np.array([0.5, -1.0, 0.25])
+    >>> J = np.array([[1.0, 0.5, 0.0], [-0.25, 0.5, 2.0], [0.0, 1.0, -0.75]])
+    >>> S = np.array([[1, 0, 1], [-1, 1, -1], [0, 0, 0], [1, 1, 1], [-1, -1, 1]])
+    >>> bool(np.allclose(ienergy_batch(h, J, S), [ienergy(h, J, s) for s in S]))
+    True
+    >>> packed = pack_spins(S)
+    >>> bool(np.allclose(ienergy_batch(h, scipy.sparse.csr_matrix(J), packed, packed=True),
+    ...                  [ienergy(h, J, s) for s in S]))
+    True
+    """
+    J = _matrix(J)
+    h = np.asarray(h)
+    S = _spins_matrix(spins, J.shape[0], packed)
+    quadratic = _quadratic_batch(J, S)
+    linear = S @ h
+    binary = S.min(axis=1, initial=0) >= 0
+    if not binary.any():
+        return quadratic + linear
+    # s J s + h s = 4 x J x - 2 x (J + J^T) 1 + 1 J 1 + 2 h x - h 1
+    mapped = 4 * quadratic - 2 * (S @ _line_sums(J)) + 2 * linear + J.sum() - h.sum()
+    return np.where(binary, mapped, quadratic + linear)
+
 
 def energy(Q, spins):
     """
@@ -17,7 +190,7 @@ def energy(Q, spins):
     2
     """
     s = (1 + np.asarray(spins).astype(int)) // 2
-    e = s @ Q @ s
+    e = energy_qubo(Q, s)
     return e
 
 
@@ -25,12 +198,24 @@ def ienergy(h, J, spins):
     """Energy for ising problem"""
     s = np.asarray(spins).astype(int)
     s[np.where(s == 0)] = -1
-    e = h @ s + s @ J @ s
+    e = energy_ising(h, J, s)
     return e
 
 
-def dump(filename, h, J):
+def dump(filename, h, J, chunk=1 << 16):
     """Dump h and J to filename in our custom format"""
+    h = np.asarray(h)
+    if scipy.sparse.issparse(J):
+        upper = scipy.sparse.triu(J, k=1, format="csr")
+        upper.sort_indices()
+        upper = upper.tocoo()
+        rows, cols, values = upper.row, upper.col, upper.data
+    else:
+        J = np.asarray(J)
+        rows, cols = np.nonzero(np.triu(J, k=1))
+        values = J[rows, cols]
+    nonzero = values != 0
+    rows, cols, values = rows[nonzero] + 1, cols[nonzero] + 1, values[nonzero]
     with open(filename, "w") as fp:
         fp.write(
                 "3.0\n"
@@ -39,14 +224,102 @@ def dump(filename, h, J):
                 "0.07\n"
                 + str(h.size) + "\n"
         )
-        s = "\n".join(map(str, h)) + "\n"
+        s = "\n".join(map(str, h.tolist())) + "\n"
         fp.write(s)
-        L = []
-        for i in range(h.size):
-            for j in range(i + 1, h.size):
-                if J[i, j]:
-                    L.append("{} {} {}\n".format(1 + i, 1 + j, J[i, j]))
-        fp.write("".join(L))
+        for start in range(0, values.size, chunk):
+            end = start + chunk
+            fp.write("".join(map(
+                "{} {} {}\n".format,
+                rows[start:end].tolist(), cols[start:end].tolist(), values[start:end].tolist()
+            )))
+
+
+def load(filename, sparse=True, chunk=1 << 16):
+    """Load h and J dumped by `dump`.
+
+    Couplings are parsed `chunk` lines at a time, J is returned as upper triangular CSR
+    matrix (or ndarray if `sparse` is false).
+    """
+    with open(filename) as fp:
+        for _ in range(4):
+            fp.readline()
+        size = int(fp.readline())
+        h = np.loadtxt(itertools.islice(fp, size), dtype=float, ndmin=1)
+        rows, cols, values = [], [], []
+        while True:
+            lines = list(itertools.islice(fp, chunk))
+            if not lines:
+                break
+            block = np.loadtxt(lines, dtype=float, ndmin=2)
+            rows.append(block[:, 0].astype(np.int64) - 1)
+            cols.append(block[:, 1].astype(np.int64) - 1)
+            values.append(block[:, 2])
+    if values:
+        rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    J = scipy.sparse.csr_matrix((values, (rows, cols)), shape=(size, size))
+    return h, J if sparse else J.toarray()
+
+
+BINARY_MAGIC = b"QBOARDQ\0"
+# magic, version, layout (0 dense, 1 csr), rows, cols, nnz, data dtype, index dtype
+BINARY_HEADER = struct.Struct("<8sIIQQQ8s8s")
+BINARY_ALIGN = 64
+
+
+def _aligned(offset):
+    return -(-offset // BINARY_ALIGN) * BINARY_ALIGN
+
+
+def dump_binary(filename, Q):
+    """Write Q in a binary format which `load_binary` maps into memory without copies.
+
+    Header is followed by 64-byte aligned raw arrays: the matrix for dense Q, CSR data,
+    indices and indptr for sparse Q.
+    """
+    if scipy.sparse.issparse(Q):
+        Q = scipy.sparse.csr_matrix(Q)
+        Q.sum_duplicates()
+        index_dtype = np.dtype("<i4") if max(Q.nnz, *Q.shape) < 2 ** 31 else np.dtype("<i8")
+        layout, nnz = 1, Q.nnz
+        arrays = [Q.data.astype("<f8"), Q.indices.astype(index_dtype), Q.indptr.astype(index_dtype)]
+    else:
+        Q = np.asarray(Q)
+        index_dtype = np.dtype("<i8")
+        layout, nnz = 0, Q.size
+        arrays = [Q.astype("<f8")]
+    header = BINARY_HEADER.pack(BINARY_MAGIC, 1, layout, Q.shape[0], Q.shape[1], nnz,
+                                b"<f8", index_dtype.str.encode())
+    with open(filename, "wb") as fp:
+        fp.write(header)
+        for a in arrays:
+            fp.write(b"\0" * (_aligned(fp.tell()) - fp.tell()))
+            fp.write(np.ascontiguousarray(a).data)
+
+
+def load_binary(filename):
+    """Open a matrix written by `dump_binary` as read-only np.memmap (or CSR over memmaps)"""
+    with open(filename, "rb") as fp:
+        header = BINARY_HEADER.unpack(fp.read(BINARY_HEADER.size))
+    magic, version, layout, n_rows, n_cols, nnz, data_dtype, index_dtype = header
+    if magic != BINARY_MAGIC or version != 1:
+        raise ValueError("{} is not a qboard binary matrix".format(filename))
+    data_dtype = np.dtype(data_dtype.rstrip(b"\0").decode())
+    index_dtype = np.dtype(index_dtype.rstrip(b"\0").decode())
+    offset = BINARY_HEADER.size
+
+    def section(dtype, shape):
+        nonlocal offset
+        offset = _aligned(offset)
+        a = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+        offset += a.nbytes
+        return a
+
+    if layout == 0:
+        return section(data_dtype, (n_rows, n_cols))
+    data = section(data_dtype, (nnz,))
+    indices = section(index_dtype, (nnz,))
+    indptr = section(index_dtype, (n_rows + 1,))
+    return scipy.sparse.csr_matrix((data, indices, indptr), shape=(n_rows, n_cols), copy=False)
 
 
 def toising(Q):
@@ -58,6 +331,12 @@ def toising(Q):
     [[0.   0.5 ]
      [0.75 0.  ]]
     """
+    if scipy.sparse.issparse(Q):
+        Q = scipy.sparse.csr_matrix(Q)
+        h = np.asarray(Q.sum(axis=1)).ravel() / 4 + np.asarray(Q.sum(axis=0)).ravel() / 4
+        J = (Q - scipy.sparse.diags(Q.diagonal())) / 4
+        J.eliminate_zeros()
+        return h, J
     Q = np.asarray(Q)
     h = (Q.sum(axis=1) + Q.sum(axis=0)) / 4
     J = (Q - np.diag(np.diag(Q))) / 4
@@ -71,12 +350,18 @@ def fromising(h, J):
     [[1. 2.]
      [3. 4.]]
     """
-    h, J = np.asarray(h), np.asarray(J)
+    h = np.asarray(h)
+    if scipy.sparse.issparse(J):
+        J = scipy.sparse.csr_matrix(J)
+        row_sums = np.asarray(J.sum(axis=1)).ravel()
+        col_sums = np.asarray(J.sum(axis=0)).ravel()
+        return (4 * J + 2 * scipy.sparse.diags(h - col_sums - row_sums)).tocsr()
+    J = np.asarray(J)
     Q = 4 * J + 2 * np.diag(h - J.sum(axis=0) - J.sum(axis=1))
     return Q
 
 
-def constrain(Q, constraints, n):
+def constrain(Q, constraints, n, sparse=None):
     """\
     Append constraints to qubo matrix increasing size of matrix to n * len(constraints)
     >>> Q, const = constrain([[1000, 1000], [1000, 1000]], [([0, 1], 4), ([1, 3], 8)], 2)
@@ -89,24 +374,45 @@ def constrain(Q, constraints, n):
      [   4   12    0    0    8  -48]]
     >>> const
     80
+
+    The result is a CSR matrix if `sparse` is true, by default it is sparse for sparse Q.
     """
+    if sparse is None:
+        sparse = scipy.sparse.issparse(Q)
+    P = np.array([p for p, _ in constraints], dtype=float).reshape(len(constraints), -1)
+    b = np.array([b for _, b in constraints], dtype=float)
+    m, k = P.shape
     base = 2.0 ** np.arange(-n, 0)
-    baseM = np.outer(base, base)
-    edges = []
-    bs = []
-    Q = Q.copy()
-    for p, b in constraints:
-        Q += np.outer(p, p) - 2 * b * np.diag(p)
-        edges.append(np.outer(p, b * base))
-        bs.append(b)
-    size = Q.shape[0] + n * len(edges)
-    edge = np.hstack(edges)
-    QQ = np.empty((size, size))
-    QQ[: Q.shape[0], : Q.shape[0]] = Q
-    QQ[: Q.shape[0], Q.shape[0] :] = edge
-    QQ[Q.shape[0] :, : Q.shape[0]] = edge.T
-    QQ[Q.shape[0] :, Q.shape[0] :] = scipy.linalg.block_diag(
-        *((baseM - 2 * np.diag(base)) * b ** 2 for b in bs)
-    )
+    block = np.outer(base, base) - 2 * np.diag(base)
     const = sum(_[1] ** 2 for _ in constraints)
+    size = k + n * m
+    # sum_c (p_c s - b_c)^2 expands into P^T P and -2 P^T b on the original variables
+    linear = P.T @ b
+
+    if sparse:
+        P_sparse = scipy.sparse.csc_matrix(P)
+        top = (scipy.sparse.csr_matrix(asmatrix(Q)) + P_sparse.T @ P_sparse).tocoo()
+        edge = P_sparse.T.tocoo()
+        edge_rows = np.repeat(edge.row, n)
+        edge_cols = (k + edge.col[:, None] * n + np.arange(n)).ravel()
+        edge_data = (edge.data * b[edge.col])[:, None] * base
+        block_index = k + np.arange(m)[:, None] * n + np.arange(n)
+        rows = np.concatenate((top.row, np.arange(k), edge_rows, edge_cols,
+                               np.repeat(block_index, n, axis=1).ravel()))
+        cols = np.concatenate((top.col, np.arange(k), edge_cols, edge_rows,
+                               np.tile(block_index, n).ravel()))
+        data = np.concatenate((top.data, -2 * linear, edge_data.ravel(), edge_data.ravel(),
+                               (b[:, None, None] ** 2 * block).ravel()))
+        return scipy.sparse.csr_matrix((data, (rows, cols)), shape=(size, size)), const
+
+    QQ = np.zeros((size, size))
+    top = QQ[:k, :k]
+    top += dense(Q)
+    top += P.T @ P
+    top[np.diag_indices(k)] -= 2 * linear
+    edge = QQ[:k, k:].reshape(k, m, n)
+    edge[...] = P.T[:, :, None] * (b[:, None] * base)
+    QQ[k:, :k] = QQ[:k, k:].T
+    blocks = QQ[k:, k:].reshape(m, n, m, n)
+    blocks[np.arange(m), :, np.arange(m), :] = b[:, None, None] ** 2 * block
     return QQ, const
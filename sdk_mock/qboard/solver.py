@@ -1,18 +1,28 @@
 #!/usr/bin/env python
+import functools
 import numpy as np
 import sys
+import time
 import logging
 from qboard import qubo
+import qboard.cache
 import qboard.utils
 from qboard.utils import Logger
 from qboard.constants import *
 
+# Problem index of a single-problem solve within a batch, bound with functools.partial
+def _constant(index, problem):
+    return index
+
 class solver:
 
-    supported_modes = {"bf"}
+    supported_modes = {"bf", "bb", "sa", "pt", "simcim", "tabu"}
+    # results of these modes depend on random numbers, they are cached only with a fixed seed
+    randomized_modes = {"sa", "pt", "simcim", "tabu"}
 
-    def __init__(self, mode, enable_cache=True, verbosity=1, params={}, log_logger = None):
+    def __init__(self, mode, enable_cache=True, verbosity=1, params={}, log_logger = None, cache_dir = None):
         self.logger = Logger(verbosity = verbosity, log_logger = log_logger)
+        self.cache = qboard.cache.get_cache(cache_dir)
         self.gparams = {"enable_cache": enable_cache, "verbosity": verbosity, "logger": self.logger}
         self.mparams = params.copy()
         self.mode = mode
@@ -25,7 +35,11 @@ class solver:
             if payload["cb_type"] == CB_TYPE_NEW_SOLUTION:
                 self.logger.log("Found solution %f" % payload["energy"], 1)
             elif payload["cb_type"] == CB_TYPE_INTERRUPT_TIMEOUT:
+                self.incomplete = True
                 self.logger.log("Solver interrupted by timeout. Best solution is %f" % payload["energy"], 1)
+            elif payload["cb_type"] == CB_TYPE_INTERRUPT_CANCEL:
+                self.incomplete = True
+                self.logger.log("Solver cancelled. Best solution is %f" % payload["energy"], 1)
             if "callback" in self.gparams:
                 self.gparams["callback"](payload)
 
@@ -33,13 +47,48 @@ class solver:
         self.gparams_mod["callback"] = callback_handler
         self.gparams_mod["logger"] = self.logger
 
+    # Whether the result is reproducible and may be taken from the cache
+    def _cacheable(self, gparams, mparams):
+        if not gparams.get("enable_cache"):
+            return False
+        mode = mparams.get("mode", "bf") if self.mode[:6] == "remote" else self.mode
+        return mode not in self.randomized_modes or mparams.get("seed") is not None
+
     def _solve(self, Q=None, h=None, J=None, gparams = {}, mparams = {}):
-        if self.basis == "qubo":
-            h, J = qubo.toising(Q)
-            Q = np.asarray(Q)
-        else:
-            Q = qubo.fromising(h, J)
-        shift = (Q.sum() + Q.trace()) / 4
+        if not self._cacheable(gparams, mparams):
+            return self._run(Q=Q, h=h, J=J, gparams = gparams, mparams = mparams)
+
+        arrays = (Q,) if self.basis == "qubo" else (h, J)
+        key = qboard.cache.key(self.basis, self.mode, mparams, gparams.get("target"), *arrays)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.logger.log("Solver %s result taken from cache" % self.mode, 1)
+            return self._replay(cached, gparams)
+        self.incomplete = False
+        spins, energy = self._run(Q=Q, h=h, J=J, gparams = gparams, mparams = mparams)
+        # result interrupted by timeout or cancellation depends on machine load, do not reuse it
+        if not self.incomplete:
+            self.cache.put(key, spins, energy)
+        return spins, energy
+
+    # Report cached result through the same callbacks as a finished solve, the caller gets
+    # its own copy of the spins
+    def _replay(self, cached, gparams):
+        spins, energy = cached
+        gparams["callback"]({"spins": spins.copy(), "energy": energy, "cb_type": CB_TYPE_NEW_SOLUTION})
+        if "target" in gparams and energy <= gparams["target"]:
+            gparams["callback"]({"spins": spins.copy(), "energy": energy, "cb_type": CB_TYPE_INTERRUPT_TARGET})
+        return spins.copy(), energy
+
+    def _run(self, Q=None, h=None, J=None, gparams = {}, mparams = {}):
+        # solvers convert between bases themselves, only when they need to
+        if "dtype" in mparams:
+            if self.basis == "qubo":
+                Q = qubo.compact(Q, mparams["dtype"])
+            else:
+                h, J = np.asarray(h, dtype=mparams["dtype"]), qubo.compact(J, mparams["dtype"])
+        elif self.basis == "qubo":
+            Q = qubo.asmatrix(Q, dtype=None)
 
         self.logger.log("Solver %s started" % self.mode, 1)
 
@@ -59,6 +108,38 @@ class solver:
             else:
                 spins, energy = solver.solve_ising(h, J)
             return spins, energy
+        elif self.mode == "bb":
+            from qboard.solvers.bb_solver import BBSolver
+            solver = BBSolver(gparams = gparams, mparams = mparams)
+            if self.basis == "qubo":
+                spins, energy = solver.solve_qubo(Q)
+            else:
+                spins, energy = solver.solve_ising(h, J)
+            return spins, energy
+        elif self.mode == "sa":
+            from qboard.solvers.sa_solver import SASolver
+            solver = SASolver(gparams = gparams, mparams = mparams)
+            if self.basis == "qubo":
+                spins, energy = solver.solve_qubo(Q)
+            else:
+                spins, energy = solver.solve_ising(h, J)
+            return spins, energy
+        elif self.mode == "pt":
+            from qboard.solvers.pt_solver import PTSolver
+            solver = PTSolver(gparams = gparams, mparams = mparams)
+            if self.basis == "qubo":
+                spins, energy = solver.solve_qubo(Q)
+            else:
+                spins, energy = solver.solve_ising(h, J)
+            return spins, energy
+        elif self.mode == "tabu":
+            from qboard.solvers.tabu_solver import TabuSolver
+            solver = TabuSolver(gparams = gparams, mparams = mparams)
+            if self.basis == "qubo":
+                spins, energy = solver.solve_qubo(Q)
+            else:
+                spins, energy = solver.solve_ising(h, J)
+            return spins, energy
         elif self.mode == "dwave":
             from qboard.solvers.dwave_adapter import DWaveAdapter
             solver = DWaveAdapter(gparams = gparams, mparams = mparams)
@@ -69,16 +150,85 @@ class solver:
             return spins, energy
         elif self.mode[:6] == "remote":
             from qboard.solvers.remote_adapter import RemoteAdapter
-            solver = RemoteAdapter(self.mode.split(":")[1], gparams = gparams, mparams = mparams)
+            solver = RemoteAdapter(self.mode.split(":", 1)[1], gparams = gparams, mparams = mparams)
             if self.basis == "qubo":
                 spins, energy = solver.solve_qubo(Q)
             else:
                 spins, energy = solver.solve_ising(h, J)
             return spins, energy
 
-    def solve_qubo(self, Q, timeout=None, target=None, callback=None, enable_cache=None, verbosity=None, params={}):
+    def _solve_batch(self, Qs, gparams = {}, mparams = {}):
+        # nested lists are accepted like by solve_qubo
+        Qs = [qubo.asmatrix(Q, dtype=None) for Q in Qs]
+        results = [None] * len(Qs)
+        caching = self._cacheable(gparams, mparams)
+        if caching:
+            keys = [qboard.cache.key("qubo", self.mode, mparams, gparams.get("target"), Q) for Q in Qs]
+            for i, key in enumerate(keys):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.logger.log("Solver %s result of problem %i taken from cache" % (self.mode, i), 1)
+                    results[i] = self._replay(cached, self._tagged(gparams, functools.partial(_constant, i)))
+        todo = [i for i, result in enumerate(results) if result is None]
+
+        self.incomplete = False
+        self.batch_start = time.time()
+        solved = self._run_batch([Qs[i] for i in todo], self._tagged(gparams, todo.__getitem__), mparams)
+        for i, result in zip(todo, solved):
+            results[i] = result
+            if caching and not self.incomplete:
+                self.cache.put(keys[i], *result)
+        return results
+
+    # Copy of gparams with callback payloads tagged by the index of their problem in the batch
+    def _tagged(self, gparams, index):
+        def callback(payload):
+            payload["problem"] = index(payload.get("problem"))
+            gparams["callback"](payload)
+
+        tagged = gparams.copy()
+        tagged["callback"] = callback
+        return tagged
+
+    def _run_batch(self, Qs, gparams = {}, mparams = {}):
+        if not Qs:
+            return []
+        if self.mode == "bf":
+            from qboard.solvers.bf_solver import BFSolver
+            # problems of the same size are stacked and solved together
+            groups = {}
+            for i, Q in enumerate(Qs):
+                groups.setdefault(Q.shape[0], []).append(i)
+            results = [None] * len(Qs)
+            for group in groups.values():
+                if "dtype" in mparams:
+                    stack = np.stack([qubo.dense(qubo.compact(Qs[i], mparams["dtype"]), mparams["dtype"]) for i in group])
+                else:
+                    stack = np.stack([qubo.dense(Qs[i]) for i in group])
+                solver = BFSolver(gparams = self._remaining(self._tagged(gparams, group.__getitem__)), mparams = mparams)
+                for i, result in zip(group, solver.solve_qubo_batch(stack)):
+                    results[i] = result
+            return results
+        elif self.mode[:6] == "remote":
+            from qboard.solvers.remote_adapter import RemoteAdapter
+            solver = RemoteAdapter(self.mode.split(":", 1)[1], gparams = gparams, mparams = mparams)
+            return solver.solve_many([("qubo", (Q,)) for Q in Qs])
+        # no batched kernels for the mode, solve one by one within the common timeout
+        results = []
+        for i, Q in enumerate(Qs):
+            gparams_current = self._remaining(self._tagged(gparams, functools.partial(_constant, i)))
+            results.append(self._run(Q=Q, gparams = gparams_current, mparams = mparams))
+        return results
+
+    # Timeout of a batch covers all of its problems, pass on the time left
+    def _remaining(self, gparams):
+        if "timeout" in gparams:
+            gparams["timeout"] = max(gparams["timeout"] - (time.time() - self.batch_start), 0)
+        return gparams
+
+    def solve_qubo(self, Q, timeout=None, target=None, callback=None, enable_cache=None, verbosity=None, params={}, interval=None, cancel=None):
         gparams_current = self.gparams_mod.copy()
-        gparams_current.update(qboard.utils.filter_params({"target": target, "timeout": timeout, "enable_cache": enable_cache, "verbosity": verbosity}))
+        gparams_current.update(qboard.utils.filter_params({"target": target, "timeout": timeout, "enable_cache": enable_cache, "verbosity": verbosity, "interval": interval, "cancel": cancel}))
         v = self.logger.verbosity
         if verbosity != None:
             self.logger.verbosity = verbosity
@@ -93,9 +243,9 @@ class solver:
         self.logger.verbosity = v
         return result
 
-    def solve_ising(self, h, J, timeout=None, target=None, callback=None, enable_cache=None, verbosity=None, params={}):
+    def solve_ising(self, h, J, timeout=None, target=None, callback=None, enable_cache=None, verbosity=None, params={}, interval=None, cancel=None):
         gparams_current = self.gparams_mod.copy()
-        gparams_current.update(qboard.utils.filter_params({"target": target, "timeout": timeout, "enable_cache": enable_cache, "verbosity": verbosity}))
+        gparams_current.update(qboard.utils.filter_params({"target": target, "timeout": timeout, "enable_cache": enable_cache, "verbosity": verbosity, "interval": interval, "cancel": cancel}))
         v = self.logger.verbosity
         if verbosity != None:
             self.logger.verbosity = verbosity
@@ -109,3 +259,27 @@ class solver:
         result = self._solve(h=h, J=J, gparams = gparams_current, mparams = mparams_current)
         self.logger.verbosity = v
         return result
+
+    def solve_qubo_batch(self, Qs, timeout=None, target=None, callback=None, enable_cache=None, verbosity=None, params={}, interval=None, cancel=None):
+        """Solve a list of independent problems, return a list of (spins, energy).
+
+        Callback payloads carry the index of their problem under the `problem` key, timeout
+        covers the whole batch. Same-size problems are solved together by vectorized kernels
+        in `bf` mode and pipelined to the host in `remote` mode, other modes solve the
+        problems one by one.
+        """
+        gparams_current = self.gparams_mod.copy()
+        gparams_current.update(qboard.utils.filter_params({"target": target, "timeout": timeout, "enable_cache": enable_cache, "verbosity": verbosity, "interval": interval, "cancel": cancel}))
+        v = self.logger.verbosity
+        if verbosity != None:
+            self.logger.verbosity = verbosity
+        if callback != None:
+            self.gparams["callback"] = callback
+        else:
+            self.gparams.pop("callback", None)
+        mparams_current = self.mparams.copy()
+        mparams_current.update(params)
+        self.basis = "qubo"
+        result = self._solve_batch(list(Qs), gparams = gparams_current, mparams = mparams_current)
+        self.logger.verbosity = v
+        return result
@@ -0,0 +1,182 @@
+import abc
+import time
+
+import numpy as np
+from qboard import qubo
+from qboard.constants import *
+
+
+class BaseSolver(abc.ABC):
+    """Common part of local solvers.
+
+    Subclasses implement `solve(Q)` for a QUBO matrix and report progress through
+    `new_solution` and `interrupted`, basis conversion of results and callback payloads
+    is done here.
+
+    With the `interval` global param (seconds) improvements are coalesced: equal energies
+    are dropped and the best new solution is delivered at most once per interval, followed
+    by a CB_TYPE_INTERRUPT_INTERVAL heartbeat carrying the best solution so far.
+
+    The `dtype` mode param (`float64` by default) is the precision solvers keep the problem
+    and their state in, `float32` halves memory and bandwidth of the inner loops. Reported
+    energies are always recomputed in double precision.
+
+    The `cancel` global param is a token with `is_set()` (e.g. threading.Event) checked on
+    every `interrupted` call, once it is set the solver stops with CB_TYPE_INTERRUPT_CANCEL.
+    """
+
+    #: event checked by hot loops, solver stops silently once it is set
+    stop_event = None
+    #: solver specific statistics attached to every callback payload when set
+    statistics = None
+    #: number of candidates evaluated so far, attached to callback payloads when counted
+    evaluations = None
+    #: index of the problem solved by `solve` within `solve_batch`
+    problem = None
+
+    def __init__(self, gparams = {}, mparams = {}):
+        self.gparams = gparams.copy()
+        self.mparams = mparams.copy()
+        self.gparams_mod = self.gparams.copy()
+        self.dtype = np.dtype(self.mparams.get("dtype", "float64"))
+
+    def solve_ising(self, h, J):
+        self.basis = "ising"
+        self.h = h
+        self.J = J
+        Q = qubo.fromising(h, J)
+        self.offset = qubo.shift(Q)
+        self.handle_params()
+        self.time_start = time.time()
+        spins_qubo, energy_qubo = self.solve(Q)
+        self.flush()
+        spins_ising = [(s * 2 - 1) for s in spins_qubo]
+        energy_ising = qubo.energy_ising(np.asarray(h), J, np.asarray(spins_ising))
+        return spins_ising, energy_ising
+
+    def solve_qubo(self, Q):
+        self.basis = "qubo"
+        self.handle_params()
+        self.time_start = time.time()
+        result = self.solve(Q)
+        self.flush()
+        return result
+
+    def solve_qubo_batch(self, Qs):
+        self.basis = "qubo"
+        self.handle_params()
+        self.time_start = time.time()
+        results = self.solve_batch(Qs)
+        self.flush()
+        return results
+
+    @abc.abstractmethod
+    def solve(self, Q):
+        """Solve a QUBO matrix, return (spins, energy)"""
+
+    def solve_batch(self, Qs):
+        """Solve a stack of same-size problems (count x size x size), return a list of
+        (spins, energy). Callbacks of every problem carry its index under the `problem` key.
+
+        Problems are solved one by one, solvers with batched kernels override it."""
+        results = []
+        try:
+            for k, Q in enumerate(Qs):
+                self.problem = k
+                results.append(self.solve(Q))
+                # coalesced state of a problem solved by `solve` is kept under None
+                self._reset(None)
+        finally:
+            self.problem = None
+        return results
+
+    def new_solution(self, spins_qubo, energy_qubo, problem=None):
+        if self.interval is not None:
+            if energy_qubo < self.best.get(problem, (None, np.inf))[1]:
+                self.best[problem] = spins_qubo, energy_qubo
+                self.pending.add(problem)
+            return
+        self.notify(CB_TYPE_NEW_SOLUTION, spins_qubo, energy_qubo, problem)
+
+    def notify(self, cb_type, spins_qubo, energy_qubo, problem=None):
+        if problem is None:
+            problem = self.problem
+        payload = {"_spins": spins_qubo, "_energy": energy_qubo, "cb_type": cb_type}
+        if problem is not None:
+            payload["problem"] = problem
+        self.gparams_mod["callback"](payload)
+
+    # Deliver coalesced improvements of all problems, or of the given one
+    def flush(self, *problems):
+        for problem in sorted(problems or self.pending, key=lambda p: -1 if p is None else p):
+            if problem in self.pending:
+                self.pending.remove(problem)
+                self.notify(CB_TYPE_NEW_SOLUTION, *self.best[problem], problem)
+
+    # Deliver a finished problem's pending improvement and forget its coalescing state
+    def _reset(self, problem):
+        self.flush(problem)
+        self.best.pop(problem, None)
+        self.next_interval.pop(problem, None)
+
+    # Fire target or timeout interruption callback, return True if solver must stop
+    def interrupted(self, spins_qubo, energy_qubo, problem=None):
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        if self.cancel is not None and self.cancel.is_set():
+            self.flush(problem)
+            self.notify(CB_TYPE_INTERRUPT_CANCEL, spins_qubo, energy_qubo, problem)
+            return True
+        if self.interval is not None:
+            now = time.time()
+            if now >= self.next_interval.get(problem, self.time_start + self.interval):
+                self.next_interval[problem] = now + self.interval
+                self.flush(problem)
+                self.notify(CB_TYPE_INTERRUPT_INTERVAL, spins_qubo, energy_qubo, problem)
+        if (("target" in self.gparams_mod) and (energy_qubo <= self.gparams_mod["target"])):
+            self.flush(problem)
+            self.notify(CB_TYPE_INTERRUPT_TARGET, spins_qubo, energy_qubo, problem)
+            return True
+        if (("timeout" in self.gparams) and ((time.time() - self.time_start) >= self.gparams["timeout"])):
+            self.flush(problem)
+            self.notify(CB_TYPE_INTERRUPT_TIMEOUT, spins_qubo, energy_qubo, problem)
+            return True
+        return False
+
+    # Convert all basis-related parameters
+    def handle_params(self):
+        if (("target" in self.gparams) and (self.basis == "ising")):
+            self.gparams_mod["target"] = self.gparams["target"] + self.offset
+
+        self.cancel = self.gparams.get("cancel")
+        self.interval = self.gparams.get("interval")
+        # coalescing state, per problem index (None outside of batch solves)
+        self.best = {}
+        self.pending = set()
+        self.next_interval = {}
+
+        def callback(payload):
+            payload = self.modify_payload(payload)
+                
+            if self.gparams["callback"] != None:
+                self.gparams["callback"](payload)
+
+        self.gparams_mod["callback"] = callback
+
+    # Convert all basis-related payload
+    def modify_payload(self, payload):
+        if self.statistics is not None:
+            payload["statistics"] = self.statistics
+        if self.evaluations is not None:
+            payload["evaluations"] = self.evaluations
+
+        if self.basis == "qubo":
+            payload["spins"] = payload["_spins"]
+            payload["energy"] = payload["_energy"]
+        elif self.basis == "ising":
+            spins_ising = [(s * 2 - 1) for s in payload["_spins"]]
+            energy_ising = payload["_energy"] - self.offset
+            payload["spins"] = spins_ising
+            payload["energy"] = energy_ising
+
+        return payload
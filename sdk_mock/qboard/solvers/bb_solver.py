@@ -0,0 +1,94 @@
+import numpy as np
+from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
+from qboard.solvers.bf_solver import spin_matrix
+from qboard.constants import *
+
+
+class BBSolver(BaseSolver):
+    """Exact depth-first branch and bound.
+
+    Variables are fixed one by one in order of decreasing coupling strength. For a partial
+    assignment the energy of the free variables is bounded from below by
+
+        sum_j min(0, c_j + sum_{k > j} min(0, W_jk))
+
+    where c_j is the linear term of free variable j (its diagonal plus couplings with the
+    fixed variables) and W = Q + Q^T. Subtrees whose bound cannot beat the incumbent are
+    pruned. The last `leaf_bits` variables are not branched on but enumerated in one block.
+    """
+
+    def solve(self, Q):
+        Q = qubo.dense(Q, dtype=self.dtype)
+        size = Q.shape[0]
+        W = Q + Q.T
+        np.fill_diagonal(W, 0)
+        order = np.argsort(-np.abs(W).sum(axis=0), kind="stable")
+        Q = Q[np.ix_(order, order)]
+        W = W[np.ix_(order, order)]
+        diag = np.diag(Q).copy()
+        neg_after = np.triu(np.minimum(W, 0), 1).sum(axis=1)
+
+        leaf_bits = min(self.mparams.get("leaf_bits", 10), size)
+        depth_max = size - leaf_bits
+        low = spin_matrix(leaf_bits, dtype=self.dtype)
+        energy_low = qubo.energy_qubo_batch(Q[depth_max:, depth_max:], low)
+
+        spins, energy = self.local_search(Q, W, diag)
+        self.order = order
+        self.report(spins, energy)
+
+        # node: (depth, energy of fixed variables, linear terms of all variables, fixed spins)
+        stack = [(0, 0.0, diag, np.zeros(size, dtype=int))]
+        while stack:
+            if self.interrupted(self.unpermute(spins), energy):
+                break
+            depth, e_fixed, c, s = stack.pop()
+            if depth == depth_max:
+                energies = e_fixed + low @ (c[depth:] - diag[depth:]) + energy_low
+                i = np.argmin(energies)
+                if energies[i] < energy:
+                    s = s.copy()
+                    s[depth:] = low[i]
+                    e = qubo.energy_qubo(Q, s)
+                    if e < energy:
+                        spins, energy = s, e
+                        self.report(spins, energy)
+                continue
+            # both children share the bound of the remaining variables except the branched one
+            rest = np.minimum(c[depth + 1:] + neg_after[depth + 1:], 0).sum()
+            c_one = c + W[depth]
+            rest_one = np.minimum(c_one[depth + 1:] + neg_after[depth + 1:], 0).sum()
+            children = []
+            if e_fixed + rest < energy:
+                children.append((rest, (depth + 1, e_fixed, c, s)))
+            if e_fixed + c[depth] + rest_one < energy:
+                s_one = s.copy()
+                s_one[depth] = 1
+                children.append((c[depth] + rest_one, (depth + 1, e_fixed + c[depth], c_one, s_one)))
+            # the more promising child is pushed last and explored first
+            children.sort(key=lambda child: -child[0])
+            stack.extend(child for _, child in children)
+
+        return self.unpermute(spins), energy
+
+    # Greedy one-flip descent from all zeros, gives the first incumbent
+    def local_search(self, Q, W, diag):
+        spins = np.zeros(Q.shape[0], dtype=int)
+        field = diag.copy()
+        while True:
+            delta = (1 - 2 * spins) * field
+            j = np.argmin(delta)
+            if delta[j] >= 0:
+                return spins, spins @ Q @ spins
+            field += (1 - 2 * spins[j]) * W[j]
+            spins[j] ^= 1
+
+    def unpermute(self, spins):
+        result = np.empty_like(spins)
+        result[self.order] = spins
+        return result
+
+    def report(self, spins, energy):
+        spins = self.unpermute(spins)
+        self.new_solution(spins, energy)
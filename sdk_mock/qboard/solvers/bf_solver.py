@@ -1,84 +1,237 @@
 import numpy as np
 from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
 from qboard.constants import *
-import time
-import itertools
-
-class BFSolver:
-
-    def __init__(self, gparams = {}, mparams = {}):
-        self.gparams = gparams.copy()
-        self.mparams = mparams.copy()
-        self.gparams_mod = self.gparams.copy()
-
-    def solve_ising(self, h, J):
-        self.basis = "ising"
-        self.h = h
-        self.J = J
-        Q = qubo.fromising(h, J)
-        self.offset = (Q.sum() + Q.trace()) / 4
-        self.handle_params()
-        spins_qubo, energy_qubo = self.solve(Q)
-        spins_ising = [(s * 2 - 1) for s in spins_qubo]
-        energy_ising = J.dot(spins_ising).dot(spins_ising) + h.dot(spins_ising)
-        return spins_ising, energy_ising
-
-    def solve_qubo(self, Q):
-        self.basis = "qubo"
-        self.handle_params()
-        return self.solve(Q)
+import math
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+def spin_matrix(size, dtype=float):
+    """All 2^size binary vectors as rows, in itertools.product((0, 1), repeat=size) order"""
+    shifts = 2 ** np.arange(size - 1, -1, -1)
+    return ((np.arange(2 ** size)[:, None] // shifts) % 2).astype(dtype)
+
+
+# Shard process state, set once per pool process by _init_shard
+_shard = {}
+
+
+def _init_shard(shm_name, shape, dtype, mparams, messages, stop_event, best):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shard.update({
+        "shm": shm,
+        "Q": np.ndarray(shape, dtype=dtype, buffer=shm.buf),
+        "mparams": mparams,
+        "messages": messages,
+        "stop_event": stop_event,
+        "best": best,
+    })
+
+
+def _solve_shard(prefix):
+    """Solve subproblem with the first variables fixed to the bits of prefix"""
+    Q = _shard["Q"]
+    p = np.asarray(prefix, dtype=Q.dtype)
+    m = p.size
+    # fixed variables turn into a constant and a linear (diagonal) term of the rest
+    Q_sub = Q[m:, m:] + np.diag(p @ Q[:m, m:] + Q[m:, :m] @ p)
+    const = p @ Q[:m, :m] @ p
+
+    def forward(payload):
+        if payload["cb_type"] == CB_TYPE_NEW_SOLUTION and payload["energy"] + const < _shard["best"].value:
+            _shard["messages"].put((payload["energy"] + const, np.concatenate((p.astype(int), payload["spins"]))))
+
+    solver = BFSolver(gparams = {"callback": forward}, mparams = _shard["mparams"])
+    solver.stop_event = _shard["stop_event"]
+    spins, energy = solver.solve_qubo(Q_sub)
+    return energy + const, np.concatenate((p.astype(int), spins))
+
+
+class BFSolver(BaseSolver):
 
     def solve(self, Q):
-        time_start = time.time()
-        #try:
+        Q = qubo.dense(Q, dtype=self.dtype)
+        if self.mparams.get("processes", 1) > 1:
+            if not multiprocessing.current_process().daemon:
+                return self.solve_parallel(Q)
+            # daemonic processes (e.g. multiprocessing.Pool workers) are not allowed to have children
+            if "logger" in self.gparams:
+                self.gparams["logger"].log("Parallel brute force is unavailable in a daemonic process, solving serially", 1)
+        traversal = self.mparams.get("traversal", "block")
+        if traversal == "block":
+            return self.solve_blocks(Q)
+        elif traversal == "gray":
+            return self.solve_gray(Q)
+        raise ValueError("Traversal {} not supported. Available traversals are block, gray".format(traversal))
+
+    def solve_blocks(self, Q):
         size = Q.shape[0]
-        spins_qubo = np.zeros(size)
-        energy_qubo = Q.dot(spins_qubo).dot(spins_qubo)
-        generator = map(np.array, itertools.product((0, 1), repeat=size))
-        for s in generator:
-            e = Q.dot(s).dot(s)
-            if (("target" in self.gparams_mod) and (e <= self.gparams_mod["target"])):
-                payload = {"_spins": s, "_energy": e, "cb_type": CB_TYPE_INTERRUPT_TARGET}
-                self.gparams_mod["callback"](payload)
+        # Candidates are enumerated in the same order as itertools.product((0, 1), repeat=size):
+        # the first `prefix_bits` variables are fixed per block, the last `block_bits` variables
+        # run through all 2^block_bits combinations inside the block.
+        block_bits = min(self.mparams.get("block_bits", 16), size)
+        prefix_bits = size - block_bits
+        low = spin_matrix(block_bits, dtype=Q.dtype)
+        Q_high = Q[:prefix_bits, :prefix_bits]
+        Q_low = Q[prefix_bits:, prefix_bits:]
+        # s @ Q @ s = p @ Q_high @ p + p @ coupling @ l + l @ Q_low @ l for s = (p, l)
+        coupling = Q[:prefix_bits, prefix_bits:] + Q[prefix_bits:, :prefix_bits].T
+        energy_low = qubo.energy_qubo_batch(Q_low, low)
+        shifts = 2 ** np.arange(prefix_bits - 1, -1, -1)
+
+        spins_qubo = np.zeros(size, dtype=int)
+        energy_qubo = np.inf
+        for prefix in range(2 ** prefix_bits):
+            p = ((prefix // shifts) % 2).astype(Q.dtype)
+            energies = energy_low + low @ (p @ coupling) + p @ Q_high @ p
+            i = np.argmin(energies)
+            e = energies[i]
+            self.evaluations = (prefix + 1) * len(low)
+            if e < energy_qubo:
+                # block energies are summed in a different order, confirm with the exact value
+                candidate = np.concatenate((p, low[i])).astype(int)
+                energy = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
                 break
-            if e <= energy_qubo:
-                spins_qubo = s
-                energy_qubo = e
-                payload = {"_spins": spins_qubo, "_energy": energy_qubo, "cb_type": CB_TYPE_NEW_SOLUTION}
-                self.gparams_mod["callback"](payload)
-            if (("timeout" in self.gparams) and ((time.time() - time_start) >= self.gparams["timeout"])):
-                payload = {"_spins": spins_qubo, "_energy": energy_qubo, "cb_type": CB_TYPE_INTERRUPT_TIMEOUT}
-                self.gparams_mod["callback"](payload)
+
+        return spins_qubo, energy_qubo
+
+    def solve_batch(self, Qs):
+        """Exhaustive search of a stack of same-size problems.
+
+        Same candidate order as `solve_blocks`, every block of candidates is scored for all
+        problems at once with one matrix product.
+        """
+        Qs = np.asarray(Qs, dtype=self.dtype)
+        count, size = Qs.shape[:2]
+        # keep (problems x block) energies of a block within 2^22 values
+        block_bits = min(self.mparams.get("block_bits", 16), size, max(22 - math.ceil(math.log2(count)), 1))
+        prefix_bits = size - block_bits
+        low = spin_matrix(block_bits, dtype=Qs.dtype)
+        Q_high = Qs[:, :prefix_bits, :prefix_bits]
+        coupling = Qs[:, :prefix_bits, prefix_bits:] + Qs[:, prefix_bits:, :prefix_bits].transpose(0, 2, 1)
+        energy_low = np.stack([qubo.energy_qubo_batch(Q[prefix_bits:, prefix_bits:], low) for Q in Qs])
+        shifts = 2 ** np.arange(prefix_bits - 1, -1, -1)
+
+        problems = np.arange(count)
+        spins = np.zeros((count, size), dtype=int)
+        energy = np.full(count, np.inf)
+        active = np.ones(count, dtype=bool)
+        for prefix in range(2 ** prefix_bits):
+            p = ((prefix // shifts) % 2).astype(Qs.dtype)
+            energies = energy_low + (p @ coupling) @ low.T + ((Q_high @ p) @ p)[:, None]
+            i = np.argmin(energies, axis=1)
+            for k in np.flatnonzero(active & (energies[problems, i] < energy)):
+                candidate = np.concatenate((p, low[i[k]])).astype(int)
+                energy_k = qubo.energy_qubo(Qs[k], candidate)
+                if energy_k < energy[k]:
+                    spins[k], energy[k] = candidate, energy_k
+                    self.new_solution(candidate, energy_k, k)
+            for k in np.flatnonzero(active):
+                if self.interrupted(spins[k].copy(), energy[k], k):
+                    active[k] = False
+                    self._reset(k)
+            if not active.any():
+                break
+        for k in np.flatnonzero(active):
+            self._reset(k)
+
+        return list(zip(spins, energy))
+
+    def solve_gray(self, Q):
+        size = Q.shape[0]
+        # Every lane fixes the first `lane_bits` variables to its own prefix. All lanes walk the
+        # remaining `gray_bits` variables together in Gray-code order, flipping one bit per step,
+        # so the low-order state and its field are shared and only prefix terms differ per lane.
+        lane_bits = min(self.mparams.get("lane_bits", 16), size)
+        gray_bits = size - lane_bits
+        lanes = spin_matrix(lane_bits, dtype=Q.dtype)
+        W = Q + Q.T
+        np.fill_diagonal(W, 0)
+        diag = np.diag(Q)[lane_bits:]
+        W_low = W[lane_bits:, lane_bits:]
+        # field of the low-order variables coming from the lane prefix, one row per variable
+        field_lanes = np.ascontiguousarray((lanes @ W[:lane_bits, lane_bits:]).T)
+        field_low = np.zeros(gray_bits, dtype=Q.dtype)
+        low = np.zeros(gray_bits, dtype=int)
+        energies = qubo.energy_qubo_batch(Q[:lane_bits, :lane_bits], lanes)
+
+        spins_qubo = np.zeros(size, dtype=int)
+        energy_qubo = np.inf
+        for step in range(2 ** gray_bits):
+            if step:
+                # Gray code flips the lowest set bit of the step counter
+                j = gray_bits - 1 - ((step & -step).bit_length() - 1)
+                sign = 1 - 2 * low[j]
+                delta = field_lanes[j] + (diag[j] + field_low[j])
+                if sign > 0:
+                    energies += delta
+                else:
+                    energies -= delta
+                low[j] ^= 1
+                field_low += sign * W_low[j]
+            self.evaluations = (step + 1) * len(lanes)
+            i = np.argmin(energies)
+            if energies[i] < energy_qubo:
+                # incremental energies accumulate rounding errors, confirm with the exact value
+                candidate = np.concatenate((lanes[i].astype(int), low))
+                energy = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
                 break
-        #except:
-        #    pass
 
         return spins_qubo, energy_qubo
 
-    # Convert all basis-related parameters
-    def handle_params(self):
-        if (("target" in self.gparams) and (self.basis == "ising")):
-            self.gparams_mod["target"] = self.gparams["target"] + self.offset
-
-        def callback(payload):
-            payload = self.modify_payload(payload)
-                
-            if self.gparams["callback"] != None:
-                self.gparams["callback"](payload)
-
-        self.gparams_mod["callback"] = callback
-
-    # Convert all basis-related payload
-    def modify_payload(self, payload):
-        payload = payload.copy()
-
-        if self.basis == "qubo":
-            payload["spins"] = payload["_spins"]
-            payload["energy"] = payload["_energy"]
-        elif self.basis == "ising":
-            spins_ising = [(s * 2 - 1) for s in payload["_spins"]]
-            energy_ising = payload["_energy"] - self.offset
-            payload["spins"] = spins_ising
-            payload["energy"] = energy_ising
-
-        return payload
+    def solve_parallel(self, Q):
+        size = Q.shape[0]
+        processes = self.mparams["processes"]
+        # a few shards per process so the pool can balance uneven shard runtimes
+        shard_bits = min(size, math.ceil(math.log2(processes)) + 3)
+        mparams = self.mparams.copy()
+        mparams["processes"] = 1
+        prefixes = spin_matrix(shard_bits).astype(int).tolist()
+
+        ctx = multiprocessing.get_context()
+        messages = ctx.Queue()
+        stop_event = ctx.Event()
+        best = ctx.Value("d", np.inf, lock=False)
+        shm = shared_memory.SharedMemory(create=True, size=max(Q.nbytes, 1))
+        try:
+            np.ndarray(Q.shape, dtype=Q.dtype, buffer=shm.buf)[:] = Q
+            spins_qubo = np.zeros(size, dtype=int)
+            energy_qubo = np.inf
+            with ctx.Pool(processes, initializer=_init_shard,
+                          initargs=(shm.name, Q.shape, Q.dtype, mparams, messages, stop_event, best)) as pool:
+                result = pool.map_async(_solve_shard, prefixes, chunksize=1)
+                interrupted = False
+                while not result.ready():
+                    try:
+                        e, s = messages.get(timeout=0.05)
+                    except queue.Empty:
+                        e = np.inf
+                    if e < energy_qubo:
+                        spins_qubo, energy_qubo = s, e
+                        best.value = e
+                        self.new_solution(spins_qubo, energy_qubo)
+                    if self.interrupted(spins_qubo, energy_qubo):
+                        interrupted = True
+                        stop_event.set()
+                        break
+                if not interrupted:
+                    # final shard results are exact, the message queue is only used for streaming
+                    e, s = min(result.get(), key=lambda r: r[0])
+                    if e < energy_qubo:
+                        spins_qubo, energy_qubo = s, e
+                        self.new_solution(spins_qubo, energy_qubo)
+                    self.interrupted(spins_qubo, energy_qubo)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return spins_qubo, energy_qubo
@@ -0,0 +1,74 @@
+import numpy as np
+from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
+from qboard.solvers.sa_solver import default_beta_range, metropolis_sweep
+from qboard.constants import *
+
+
+class PTSolver(BaseSolver):
+    """Parallel tempering (replica exchange).
+
+    One replica per rung of a geometric ladder of inverse temperatures. All replicas do a
+    Metropolis sweep together, every `swap_interval` sweeps neighbouring rungs exchange their
+    states. Mode params: `temperatures` (ladder size), `sweeps`, `swap_interval`, `beta_range`
+    and `seed`.
+
+    Acceptance statistics are attached to every callback payload under the `statistics` key:
+    `flip_acceptance` is the accepted flip ratio of each rung (hottest first) and
+    `swap_acceptance` is the accepted exchange ratio of each pair of neighbouring rungs.
+    """
+
+    def solve(self, Q):
+        Q = qubo.asmatrix(Q, dtype=self.dtype)
+        size = Q.shape[0]
+        rungs = self.mparams.get("temperatures", 32)
+        sweeps = self.mparams.get("sweeps", 1000)
+        swap_interval = self.mparams.get("swap_interval", 1)
+        rng = np.random.default_rng(self.mparams.get("seed"))
+        W, diag = qubo.couplings(Q)
+        beta_start, beta_end = self.mparams.get("beta_range") or default_beta_range(W, diag)
+        betas = np.geomspace(beta_start, beta_end, rungs)
+
+        spins = rng.integers(0, 2, (size, rungs)).astype(self.dtype)
+        field = W @ spins
+        energies = qubo.energy_qubo_batch(Q, spins.T)
+        flips = np.zeros(rungs)
+        swaps = np.zeros(rungs - 1)
+        swap_attempts = np.zeros(rungs - 1)
+        self.statistics = {"flip_acceptance": flips, "swap_acceptance": swaps}
+
+        i = np.argmin(energies)
+        spins_qubo = spins[:, i].astype(int)
+        energy_qubo = qubo.energy_qubo(Q, spins_qubo)
+        self.new_solution(spins_qubo, energy_qubo)
+        for sweep in range(1, sweeps + 1):
+            flips += metropolis_sweep(spins, field, energies, W, diag, betas, rng)
+            if sweep % swap_interval == 0:
+                # alternate between even and odd pairs so that every pair is independent
+                pairs = np.arange(sweep // swap_interval % 2, rungs - 1, 2)
+                swap_attempts[pairs] += 1
+                log_ratio = (betas[pairs + 1] - betas[pairs]) * (energies[pairs + 1] - energies[pairs])
+                pairs = pairs[rng.standard_exponential(size=pairs.size) > -log_ratio]
+                swaps[pairs] += 1
+                perm = np.arange(rungs)
+                perm[pairs], perm[pairs + 1] = pairs + 1, pairs
+                spins, field, energies[:] = spins[:, perm], field[:, perm], energies[perm]
+            self.statistics = {
+                "flip_acceptance": flips / (size * sweep),
+                "swap_acceptance": swaps / np.maximum(swap_attempts, 1),
+            }
+            i = np.argmin(energies)
+            if energies[i] < energy_qubo:
+                # incremental energies accumulate rounding errors, confirm with the exact value
+                candidate = spins[:, i].astype(int)
+                energy = energies[i] = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
+                break
+
+        if "logger" in self.gparams:
+            self.gparams["logger"].log("Flip acceptance per rung: %s" % self.statistics["flip_acceptance"], 2)
+            self.gparams["logger"].log("Swap acceptance per rung pair: %s" % self.statistics["swap_acceptance"], 2)
+        return spins_qubo, energy_qubo
@@ -0,0 +1,223 @@
+import json
+import socket
+import struct
+import threading
+
+import numpy as np
+import scipy.sparse
+from qboard.constants import *
+
+DEFAULT_PORT = 7341
+
+# Frame: magic, message type, request id, payload length, followed by the payload
+HEADER = struct.Struct("!2sBIQ")
+MAGIC = b"QB"
+MSG_SOLVE = 1
+MSG_CALLBACK = 2
+MSG_RESULT = 3
+MSG_ERROR = 4
+
+# SOLVE payload: metadata length, metadata json, then raw little-endian arrays,
+# sparse matrices are sent as CSR data (float64), indices and indptr (int64)
+META = struct.Struct("!I")
+# CALLBACK / RESULT payload: callback type and energy, then spins as int8
+SOLUTION = struct.Struct("!id")
+
+
+def recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by remote side")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_frame(sock, msg_type, request_id, *parts):
+    length = sum(len(p) for p in parts)
+    sock.sendall(b"".join((HEADER.pack(MAGIC, msg_type, request_id, length),) + parts))
+
+
+def recv_frame(sock):
+    magic, msg_type, request_id, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if magic != MAGIC:
+        raise ConnectionError("Invalid frame received")
+    return msg_type, request_id, recv_exact(sock, length)
+
+
+def json_default(value):
+    # numpy scalars and arrays are accepted in mode params of local modes
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("Param of type %s can't be sent to a remote solver" % type(value).__name__)
+
+
+def encode_problem(meta, arrays):
+    layout = []
+    parts = []
+    for a in arrays:
+        if scipy.sparse.issparse(a):
+            a = scipy.sparse.csr_matrix(a)
+            layout.append({"shape": a.shape, "nnz": int(a.nnz)})
+            parts += [np.ascontiguousarray(a.data, dtype="<f8"),
+                      np.ascontiguousarray(a.indices, dtype="<i8"),
+                      np.ascontiguousarray(a.indptr, dtype="<i8")]
+        else:
+            a = np.ascontiguousarray(a, dtype="<f8")
+            layout.append({"shape": a.shape})
+            parts.append(a)
+    meta = json.dumps(dict(meta, arrays=layout), default=json_default).encode()
+    return [META.pack(len(meta)), meta] + [p.data.cast("B") for p in parts]
+
+
+def decode_problem(payload):
+    (size,) = META.unpack_from(payload)
+    meta = json.loads(payload[META.size:META.size + size])
+    offset = META.size + size
+
+    def take(dtype, count):
+        nonlocal offset
+        a = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += a.nbytes
+        return a
+
+    arrays = []
+    for layout in meta["arrays"]:
+        shape = tuple(layout["shape"])
+        if "nnz" in layout:
+            data = take("<f8", layout["nnz"])
+            indices = take("<i8", layout["nnz"])
+            indptr = take("<i8", shape[0] + 1)
+            arrays.append(scipy.sparse.csr_matrix((data, indices, indptr), shape=shape))
+        else:
+            arrays.append(take("<f8", int(np.prod(shape))).reshape(shape))
+    return meta, arrays
+
+
+def encode_solution(cb_type, spins, energy):
+    return [SOLUTION.pack(cb_type, energy), np.asarray(spins, dtype=np.int8).tobytes()]
+
+
+def decode_solution(payload):
+    cb_type, energy = SOLUTION.unpack_from(payload)
+    spins = np.frombuffer(payload, dtype=np.int8, offset=SOLUTION.size).astype(int)
+    return cb_type, spins, energy
+
+
+class ConnectionPool:
+    """Persistent connections to solver hosts, reused between solves"""
+
+    def __init__(self):
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, address, fresh=False):
+        """Return a connection and a flag whether it was reused from the pool"""
+        with self.lock:
+            connections = self.idle.get(address)
+            if connections and not fresh:
+                return connections.pop(), True
+        sock = socket.create_connection(address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, False
+
+    def release(self, address, sock):
+        with self.lock:
+            self.idle.setdefault(address, []).append(sock)
+
+
+pool = ConnectionPool()
+
+
+def parse_address(address):
+    host, _, port = address.partition(":")
+    return host, int(port) if port else DEFAULT_PORT
+
+
+class RemoteAdapter:
+    """Solve problems on a remote solver host (see qboard.solvers.remote_server).
+
+    The solver mode used by the host is taken from the `mode` mode param (`bf` by default),
+    the rest of mode params are passed to the remote solver as is. Several problems can be
+    pipelined over one pooled connection with `solve_many`.
+    """
+
+    #: flag indicating a frame was received during the last exchange
+    received = False
+    #: whether callback payloads of the current exchange carry the index of their problem
+    tagged = True
+
+    def __init__(self, address, gparams = {}, mparams = {}):
+        self.address = parse_address(address)
+        self.gparams = gparams.copy()
+        self.mparams = mparams.copy()
+        self.remote_mode = self.mparams.pop("mode", "bf")
+
+    def solve_qubo(self, Q):
+        return self.solve_many([("qubo", (Q,))], tagged=False)[0]
+
+    def solve_ising(self, h, J):
+        return self.solve_many([("ising", (h, J))], tagged=False)[0]
+
+    def solve_many(self, problems, tagged=True):
+        """Solve a list of (basis, arrays) problems sent back to back over one connection.
+
+        Callbacks of all problems are delivered as they arrive, with `tagged` payloads carry
+        the position of their problem in the list under the `problem` key.
+        """
+        self.tagged = tagged
+        sock, reused = pool.acquire(self.address)
+        try:
+            results = self.exchange(sock, problems)
+        except OSError:
+            sock.close()
+            if not reused or self.received:
+                raise
+            # idle connection was closed by the host meanwhile, try once more with a new one,
+            # only if nothing was received yet, so callbacks are never delivered twice
+            sock, _ = pool.acquire(self.address, fresh=True)
+            try:
+                results = self.exchange(sock, problems)
+            except BaseException:
+                sock.close()
+                raise
+        except BaseException:
+            sock.close()
+            raise
+        pool.release(self.address, sock)
+        return results
+
+    def exchange(self, sock, problems):
+        self.received = False
+        meta = {
+            "mode": self.remote_mode,
+            "params": self.mparams,
+            "timeout": self.gparams.get("timeout"),
+            "target": self.gparams.get("target"),
+            "interval": self.gparams.get("interval"),
+        }
+        for request_id, (basis, arrays) in enumerate(problems):
+            send_frame(sock, MSG_SOLVE, request_id, *encode_problem(dict(meta, basis=basis), arrays))
+
+        results = [None] * len(problems)
+        pending = len(problems)
+        while pending:
+            msg_type, request_id, payload = recv_frame(sock)
+            self.received = True
+            if msg_type == MSG_ERROR:
+                raise RuntimeError("Remote solver error: %s" % payload.decode())
+            cb_type, spins, energy = decode_solution(payload)
+            if msg_type == MSG_CALLBACK:
+                if self.gparams.get("callback") is not None:
+                    cb_payload = {"cb_type": cb_type, "spins": spins, "energy": energy}
+                    if self.tagged:
+                        cb_payload["problem"] = request_id
+                    self.gparams["callback"](cb_payload)
+            elif msg_type == MSG_RESULT:
+                results[request_id] = spins, energy
+                pending -= 1
+        return results
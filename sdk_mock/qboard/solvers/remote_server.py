@@ -0,0 +1,92 @@
+"""Stand-in solver host for the remote:<host> mode.
+
+Runs local qboard solvers for requests received over the RemoteAdapter framing. Every
+request is solved in its own thread, so pipelined requests of one connection run
+concurrently and their frames are interleaved.
+
+    python -m qboard.solvers.remote_server --port 7341
+"""
+import argparse
+import logging
+import socketserver
+import threading
+
+import qboard
+from qboard.constants import CB_TYPE_NEW_SOLUTION
+from qboard.solvers.remote_adapter import (
+    DEFAULT_PORT, MSG_CALLBACK, MSG_ERROR, MSG_RESULT, MSG_SOLVE,
+    decode_problem, encode_solution, recv_frame, send_frame,
+)
+
+log = logging.getLogger(__name__)
+
+
+class SolveHandler(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        self.send_lock = threading.Lock()
+
+    def handle(self):
+        threads = []
+        try:
+            while True:
+                msg_type, request_id, payload = recv_frame(self.request)
+                if msg_type != MSG_SOLVE:
+                    self.send(MSG_ERROR, request_id, [b"Unexpected message type"])
+                    continue
+                thread = threading.Thread(target=self.solve, args=(request_id, payload), daemon=True)
+                thread.start()
+                threads.append(thread)
+        except ConnectionError:
+            pass
+        for thread in threads:
+            thread.join()
+
+    def solve(self, request_id, payload):
+        try:
+            meta, arrays = decode_problem(payload)
+            solver = qboard.solver(mode=meta["mode"], verbosity=0, params=meta["params"])
+
+            def callback(cb_payload):
+                parts = encode_solution(cb_payload["cb_type"], cb_payload["spins"], cb_payload["energy"])
+                self.send(MSG_CALLBACK, request_id, parts)
+
+            kwargs = {
+                "timeout": meta["timeout"], "target": meta["target"], "interval": meta.get("interval"),
+                "callback": callback,
+            }
+            if meta["basis"] == "qubo":
+                spins, energy = solver.solve_qubo(*arrays, **kwargs)
+            else:
+                spins, energy = solver.solve_ising(*arrays, **kwargs)
+            self.send(MSG_RESULT, request_id, encode_solution(CB_TYPE_NEW_SOLUTION, spins, energy))
+        except Exception as e:
+            log.exception("Request %i failed", request_id)
+            self.send(MSG_ERROR, request_id, [str(e).encode()])
+
+    def send(self, msg_type, request_id, parts):
+        with self.send_lock:
+            try:
+                send_frame(self.request, msg_type, request_id, *parts)
+            except OSError:
+                log.warning("Client gone, dropping message for request %i", request_id)
+
+
+class SolveServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with SolveServer((args.host, args.port), SolveHandler) as server:
+        log.info("Serving solver requests on %s:%i", args.host, args.port)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import numpy as np
+import scipy.sparse
+from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
+from qboard.constants import *
+
+
+def default_beta_range(W, diag):
+    """Inverse temperatures at which the largest move is accepted with probability 1/2 and
+    the smallest move with probability 1/100"""
+    if scipy.sparse.issparse(W):
+        magnitude = np.asarray(abs(W).sum(axis=1)).ravel() + np.abs(diag)
+        values = W.data
+    else:
+        magnitude = np.abs(W).sum(axis=1) + np.abs(diag)
+        values = W[W != 0]
+    nonzero = np.abs(np.concatenate((values, diag[diag != 0])))
+    if not nonzero.size:
+        return 1.0, 1.0
+    return np.log(2) / magnitude.max(), np.log(100) / nonzero.min()
+
+
+def metropolis_sweep(spins, field, energies, W, diag, beta, rng):
+    """One sequential Metropolis sweep over all variables for a batch of replicas.
+
+    spins and field are (n x replicas) arrays updated in place, field holds W @ spins.
+    energies (replicas) is updated in place, beta is a scalar or one value per replica.
+    Return number of accepted flips per replica.
+    """
+    # flipping is accepted with probability min(1, exp(-beta * delta)),
+    # that is when beta * delta is below an exponentially distributed threshold
+    thresholds = rng.standard_exponential(size=spins.shape, dtype=spins.dtype)
+    sparse = scipy.sparse.issparse(W)
+    accepted = np.zeros(spins.shape[1])
+    for j in range(spins.shape[0]):
+        sign = 1 - 2 * spins[j]
+        delta = sign * (diag[j] + field[j])
+        flip = beta * delta < thresholds[j]
+        if not flip.any():
+            continue
+        change = sign * flip
+        spins[j] += change
+        energies += delta * flip
+        if sparse:
+            row = slice(W.indptr[j], W.indptr[j + 1])
+            field[W.indices[row]] += np.outer(W.data[row], change)
+        else:
+            field += np.outer(W[j], change)
+        accepted += flip
+    return accepted
+
+
+class SASolver(BaseSolver):
+    """Simulated annealing over a batch of independent replicas.
+
+    Mode params: `replicas`, `sweeps`, `beta_range` (hot and cold inverse temperature,
+    estimated from Q by default), `schedule` (`geometric` or `linear`) and `seed`.
+    """
+
+    def solve(self, Q):
+        Q = qubo.asmatrix(Q, dtype=self.dtype)
+        size = Q.shape[0]
+        replicas = self.mparams.get("replicas", 128)
+        sweeps = self.mparams.get("sweeps", 1000)
+        rng = np.random.default_rng(self.mparams.get("seed"))
+        W, diag = qubo.couplings(Q)
+        beta_start, beta_end = self.mparams.get("beta_range") or default_beta_range(W, diag)
+        if self.mparams.get("schedule", "geometric") == "geometric":
+            betas = np.geomspace(beta_start, beta_end, sweeps)
+        else:
+            betas = np.linspace(beta_start, beta_end, sweeps)
+
+        spins = rng.integers(0, 2, (size, replicas)).astype(self.dtype)
+        field = W @ spins
+        energies = qubo.energy_qubo_batch(Q, spins.T)
+
+        i = np.argmin(energies)
+        spins_qubo = spins[:, i].astype(int)
+        energy_qubo = qubo.energy_qubo(Q, spins_qubo)
+        self.new_solution(spins_qubo, energy_qubo)
+        for beta in betas:
+            metropolis_sweep(spins, field, energies, W, diag, beta, rng)
+            i = np.argmin(energies)
+            if energies[i] < energy_qubo:
+                # incremental energies accumulate rounding errors, confirm with the exact value
+                candidate = spins[:, i].astype(int)
+                energy = energies[i] = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
+                break
+
+        return spins_qubo, energy_qubo
@@ -0,0 +1,92 @@
+import numpy as np
+from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
+from qboard.constants import *
+
+
+def pump_schedule(start, end, steps, kind="tanh"):
+    """Pump strength for every integration step"""
+    t = np.linspace(0, 1, steps)
+    if kind == "linear":
+        return start + (end - start) * t
+    elif kind == "tanh":
+        return start + (end - start) * np.tanh(3 * t) / np.tanh(3)
+    raise ValueError("Pump schedule {} not supported. Available schedules are linear, tanh".format(kind))
+
+
+def spectral_radius(A, rng, iterations=50):
+    """Power iteration estimate of the largest absolute eigenvalue of symmetric A"""
+    v = rng.standard_normal(A.shape[0])
+    radius = 0.0
+    for _ in range(iterations):
+        w = A @ v
+        radius = np.linalg.norm(w)
+        if not radius:
+            break
+        v = w / radius
+    return radius
+
+
+class SimCIMAdapter(BaseSolver):
+    """Simulated coherent Ising machine.
+
+    Integrates the amplitude dynamics
+
+        x <- clip(x + dt * (p(t) * x - zeta * (h + (J + J^T) x)) + noise * N(0, 1), -1, 1)
+
+    for a batch of trajectories at once, spins are the signs of the amplitudes. The pump p(t)
+    ramps from `pump_start` to `pump_end` following `pump_schedule` (`tanh` or `linear`).
+    Mode params: `trajectories`, `steps`, `dt`, `zeta` (inverse spectral radius of J + J^T by default),
+    `noise`, `pump_start`, `pump_end`, `pump_schedule`, `report_interval` (steps between
+    solution checks) and `seed`.
+    """
+
+    def solve(self, Q):
+        Q = qubo.asmatrix(Q, dtype=self.dtype)
+        size = Q.shape[0]
+        trajectories = self.mparams.get("trajectories", 64)
+        steps = self.mparams.get("steps", 1000)
+        dt = self.mparams.get("dt", 0.1)
+        noise = self.mparams.get("noise", 0.05)
+        report_interval = self.mparams.get("report_interval", 10)
+        rng = np.random.default_rng(self.mparams.get("seed"))
+        pump = pump_schedule(
+            self.mparams.get("pump_start", -1.0),
+            self.mparams.get("pump_end", 1.0),
+            steps,
+            self.mparams.get("pump_schedule", "tanh"),
+        )
+
+        # amplitudes live in the ising basis, qubo energy = ising energy + offset
+        h, J = qubo.toising(Q)
+        J_sym = J + J.T
+        offset = qubo.shift(Q)
+        zeta = self.mparams.get("zeta")
+        if zeta is None:
+            radius = spectral_radius(J_sym, rng)
+            zeta = 1 / radius if radius else 1.0
+
+        x = np.zeros((size, trajectories), dtype=self.dtype)
+        minus, plus = self.dtype.type(-1), self.dtype.type(1)
+        spins_qubo = np.zeros(size, dtype=int)
+        energy_qubo = np.inf
+        for step in range(steps):
+            x += dt * (pump[step] * x - zeta * (J_sym @ x + h[:, None]))
+            x += noise * rng.standard_normal(x.shape, dtype=self.dtype)
+            np.clip(x, -1, 1, out=x)
+            if (step + 1) % report_interval and step + 1 != steps:
+                continue
+            s = np.where(x < 0, minus, plus)
+            energies = qubo.energy_ising_batch(h, J, s.T) + offset
+            i = np.argmin(energies)
+            if energies[i] < energy_qubo:
+                # ising basis energies differ from qubo ones by rounding, confirm with the exact value
+                candidate = (s[:, i] > 0).astype(int)
+                energy = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
+                break
+
+        return spins_qubo, energy_qubo
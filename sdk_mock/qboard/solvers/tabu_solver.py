@@ -0,0 +1,87 @@
+import numpy as np
+import scipy.sparse
+from qboard import qubo
+from qboard.solvers.base_solver import BaseSolver
+from qboard.constants import *
+
+
+class TabuSolver(BaseSolver):
+    """Tabu search with several independent restarts advanced together.
+
+    Every restart keeps the energy change of all one-flip moves and updates it in O(n) after
+    each move. The best non-tabu move is taken (a tabu move is allowed if it improves the
+    restart's best energy), a flipped variable stays tabu for `tenure` iterations. A restart
+    that did not improve for `stall` iterations starts again from random spins.
+    Mode params: `restarts`, `iterations`, `tenure`, `stall` and `seed`.
+    """
+
+    def solve(self, Q):
+        Q = qubo.asmatrix(Q, dtype=self.dtype)
+        size = Q.shape[0]
+        restarts = self.mparams.get("restarts", 16)
+        iterations = self.mparams.get("iterations", 100 * size)
+        tenure = self.mparams.get("tenure", min(20, size // 4 + 1))
+        stall = self.mparams.get("stall", 10 * size)
+        rng = np.random.default_rng(self.mparams.get("seed"))
+        W, diag = qubo.couplings(Q)
+        sparse = scipy.sparse.issparse(W)
+        lanes = np.arange(restarts)
+
+        def initialize(rows):
+            spins[rows] = rng.integers(0, 2, (rows.size, size))
+            energies[rows] = qubo.energy_qubo_batch(Q, spins[rows])
+            # W is symmetric, spins @ W == (W @ spins.T).T also for sparse W
+            delta[rows] = (1 - 2 * spins[rows]) * (diag + (W @ spins[rows].T).T)
+            tabu[rows] = 0
+            best[rows] = energies[rows]
+            last_improvement[rows] = it
+
+        it = 0
+        spins = np.zeros((restarts, size), dtype=self.dtype)
+        energies = np.zeros(restarts, dtype=self.dtype)
+        delta = np.zeros((restarts, size), dtype=self.dtype)
+        tabu = np.zeros((restarts, size), dtype=int)
+        best = np.zeros(restarts, dtype=self.dtype)
+        last_improvement = np.zeros(restarts, dtype=int)
+        initialize(lanes)
+
+        i = np.argmin(energies)
+        spins_qubo = spins[i].astype(int)
+        energy_qubo = qubo.energy_qubo(Q, spins_qubo)
+        self.new_solution(spins_qubo, energy_qubo)
+        for it in range(1, iterations + 1):
+            admissible = (tabu <= it) | (energies[:, None] + delta < best[:, None])
+            j = np.argmin(np.where(admissible, delta, np.inf), axis=1)
+            move = delta[lanes, j]
+            # every variable may be tabu for small problems, then the restart waits
+            active = np.isfinite(np.where(admissible[lanes, j], move, np.inf))
+            change = (1 - 2 * spins[lanes, j]) * active
+            energies += move * active
+            if sparse:
+                rows = W[j].tocoo()
+                delta[rows.row, rows.col] += (1 - 2 * spins[rows.row, rows.col]) * rows.data * change[rows.row]
+            else:
+                delta += (1 - 2 * spins) * W[j] * change[:, None]
+            delta[lanes, j] = np.where(active, -move, move)
+            spins[lanes, j] += change
+            # admissible again at iteration it + tenure + 1, after `tenure` tabu iterations
+            tabu[lanes, j] = np.where(active, it + tenure + 1, tabu[lanes, j])
+
+            improved = energies < best
+            best[improved] = energies[improved]
+            last_improvement[improved] = it
+            i = np.argmin(energies)
+            if energies[i] < energy_qubo:
+                # incremental energies accumulate rounding errors, confirm with the exact value
+                candidate = spins[i].astype(int)
+                energy = energies[i] = qubo.energy_qubo(Q, candidate)
+                if energy < energy_qubo:
+                    spins_qubo, energy_qubo = candidate, energy
+                    self.new_solution(spins_qubo, energy_qubo)
+            if self.interrupted(spins_qubo, energy_qubo):
+                break
+            stalled = np.flatnonzero(it - last_improvement >= stall)
+            if stalled.size:
+                initialize(stalled)
+
+        return spins_qubo, energy_qubo
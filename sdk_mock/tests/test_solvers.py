@@ -0,0 +1,218 @@
+import itertools
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import scipy.sparse
+
+import qboard
+from qboard.constants import *
+from qboard.solvers.remote_server import SolveHandler, SolveServer
+
+# mode name, solver mode and params of every local mode, heuristics are seeded
+MODES = [
+    ("bf block", "bf", {"traversal": "block", "block_bits": 3}),
+    ("bf gray", "bf", {"traversal": "gray", "lane_bits": 3}),
+    ("bf parallel", "bf", {"processes": 2}),
+    ("bb", "bb", {"leaf_bits": 3}),
+    ("sa", "sa", {"seed": 1}),
+    ("pt", "pt", {"seed": 1}),
+    ("tabu", "tabu", {"seed": 1}),
+    ("simcim", "simcim", {"seed": 1}),
+]
+
+
+def exhaustive_qubo(Q):
+    Q = np.asarray(Q)
+    return min(s @ Q @ s for s in map(np.array, itertools.product((0, 1), repeat=Q.shape[0])))
+
+
+def exhaustive_ising(h, J):
+    return min(h @ s + s @ J @ s for s in map(np.array, itertools.product((-1, 1), repeat=len(h))))
+
+
+def problems(seed=0):
+    rng = np.random.default_rng(seed)
+    for size in (1, 5, 10):
+        yield rng.normal(size=(size, size))
+
+
+def temporary_dir(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return directory.name
+
+
+class CallbackLog:
+
+    def __init__(self):
+        self.payloads = []
+
+    def __call__(self, payload):
+        self.payloads.append(payload)
+
+    def energies(self, cb_type=CB_TYPE_NEW_SOLUTION, problem=None):
+        return [p["energy"] for p in self.payloads
+                if p["cb_type"] == cb_type and p.get("problem") == problem]
+
+
+class SolverModesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SolveServer(("127.0.0.1", 0), SolveHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.modes = MODES + [("remote", "remote:127.0.0.1:%i" % cls.server.server_address[1], {"mode": "bf"})]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def assertSolution(self, spins, energy, Q):
+        spins = np.asarray(spins)
+        self.assertAlmostEqual(energy, exhaustive_qubo(Q))
+        self.assertAlmostEqual(energy, spins @ np.asarray(Q) @ spins)
+
+    def test_dense(self):
+        for name, mode, params in self.modes:
+            for Q in problems():
+                with self.subTest(mode=name, size=Q.shape[0]):
+                    log = CallbackLog()
+                    solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+                    spins, energy = solver.solve_qubo(Q, callback=log)
+                    self.assertSolution(spins, energy, Q)
+                    self.assertFalse(any("problem" in p for p in log.payloads))
+                    improvements = log.energies()
+                    self.assertAlmostEqual(improvements[-1], energy)
+                    self.assertTrue(all(a > b for a, b in zip(improvements, improvements[1:])))
+
+    def test_sparse(self):
+        for name, mode, params in self.modes:
+            for Q in problems(1):
+                Q[np.abs(Q) < 0.7] = 0
+                with self.subTest(mode=name, size=Q.shape[0]):
+                    solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+                    spins, energy = solver.solve_qubo(scipy.sparse.csr_matrix(Q))
+                    self.assertSolution(spins, energy, Q)
+
+    def test_ising(self):
+        rng = np.random.default_rng(2)
+        for name, mode, params in self.modes:
+            for size in (1, 5, 10):
+                h = rng.normal(size=size)
+                J = np.triu(rng.normal(size=(size, size)), 1)
+                with self.subTest(mode=name, size=size):
+                    solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+                    spins, energy = solver.solve_ising(h, J)
+                    spins = np.asarray(spins)
+                    self.assertTrue(np.isin(spins, (-1, 1)).all())
+                    self.assertAlmostEqual(energy, exhaustive_ising(h, J))
+                    self.assertAlmostEqual(energy, h @ spins + spins @ J @ spins)
+
+    def test_batch(self):
+        Qs = list(problems(3)) + list(problems(4))
+        for name, mode, params in self.modes:
+            with self.subTest(mode=name):
+                log = CallbackLog()
+                solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+                results = solver.solve_qubo_batch(Qs, callback=log)
+                self.assertEqual(len(results), len(Qs))
+                self.assertEqual({p["problem"] for p in log.payloads}, set(range(len(Qs))))
+                for k, (Q, (spins, energy)) in enumerate(zip(Qs, results)):
+                    self.assertSolution(spins, energy, Q)
+                    self.assertAlmostEqual(log.energies(problem=k)[-1], energy)
+
+
+class CancelTest(TestCase):
+
+    def test_cancel(self):
+        Q = next(problems(5))
+        cancel = threading.Event()
+        cancel.set()
+        for name, mode, params in MODES:
+            if params.get("processes"):
+                continue
+            with self.subTest(mode=name):
+                log = CallbackLog()
+                solver = qboard.solver(mode=mode, enable_cache=False, verbosity=0, params=params)
+                solver.solve_qubo(Q, callback=log, cancel=cancel)
+                self.assertEqual(log.payloads[-1]["cb_type"], CB_TYPE_INTERRUPT_CANCEL)
+
+    def test_cancel_batch(self):
+        Qs = [Q for Q in problems(6) if Q.shape[0] > 1]
+        cancel = threading.Event()
+        cancel.set()
+        log = CallbackLog()
+        solver = qboard.solver(mode="bf", enable_cache=False, verbosity=0, params={"block_bits": 3})
+        solver.solve_qubo_batch(Qs, callback=log, cancel=cancel)
+        cancelled = {p["problem"] for p in log.payloads if p["cb_type"] == CB_TYPE_INTERRUPT_CANCEL}
+        self.assertEqual(cancelled, set(range(len(Qs))))
+
+    def test_cancelled_result_not_cached(self):
+        Q = list(problems(7))[-1]
+        cancel = threading.Event()
+        cancel.set()
+        solver = qboard.solver(mode="bf", verbosity=0, cache_dir=temporary_dir(self), params={"block_bits": 3})
+        solver.solve_qubo(Q, cancel=cancel)
+        _, energy = solver.solve_qubo(Q)
+        self.assertAlmostEqual(energy, exhaustive_qubo(Q))
+
+
+class CacheTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = temporary_dir(self)
+
+    def test_replay(self):
+        Q = list(problems(8))[-1]
+        solver = qboard.solver(mode="bf", verbosity=0, cache_dir=self.cache_dir)
+        spins, energy = solver.solve_qubo(Q)
+        log = CallbackLog()
+        with patch("qboard.solvers.bf_solver.BFSolver.solve", side_effect=AssertionError("not cached")):
+            replayed_spins, replayed_energy = solver.solve_qubo(Q, callback=log)
+        self.assertEqual([p["cb_type"] for p in log.payloads], [CB_TYPE_NEW_SOLUTION])
+        self.assertEqual(log.energies(), [energy])
+        self.assertEqual(replayed_energy, energy)
+        np.testing.assert_array_equal(replayed_spins, spins)
+
+    def test_replay_target(self):
+        Q = list(problems(8))[-1]
+        solver = qboard.solver(mode="bf", verbosity=0, cache_dir=self.cache_dir)
+        solver.solve_qubo(Q, target=np.inf)
+        log = CallbackLog()
+        solver.solve_qubo(Q, callback=log, target=np.inf)
+        self.assertEqual([p["cb_type"] for p in log.payloads], [CB_TYPE_NEW_SOLUTION, CB_TYPE_INTERRUPT_TARGET])
+
+    def test_replay_returns_copy(self):
+        Q = list(problems(9))[-1]
+        solver = qboard.solver(mode="bf", verbosity=0, cache_dir=self.cache_dir)
+        spins, _ = solver.solve_qubo(Q)
+        expected = np.array(spins)
+        spins[:] = 1 - expected
+        replayed_spins, _ = solver.solve_qubo(Q, callback=lambda payload: payload["spins"].fill(0))
+        np.testing.assert_array_equal(replayed_spins, expected)
+        replayed_spins[:] = 1 - expected
+        np.testing.assert_array_equal(solver.solve_qubo(Q)[0], expected)
+
+    def test_randomized_mode_cached_with_seed(self):
+        Q = list(problems(10))[-1]
+        for params, replays in (({"seed": 1}, True), ({}, False)):
+            with self.subTest(params=params):
+                solver = qboard.solver(mode="tabu", verbosity=0, cache_dir=temporary_dir(self), params=params)
+                solver.solve_qubo(Q)
+                cached = solver.cache.get(qboard.cache.key("qubo", "tabu", params, None, Q))
+                self.assertEqual(cached is not None, replays)
+
+    def test_batch_replay(self):
+        Qs = list(problems(11))
+        solver = qboard.solver(mode="bf", verbosity=0, cache_dir=self.cache_dir)
+        results = solver.solve_qubo_batch(Qs[:2])
+        log = CallbackLog()
+        replayed = solver.solve_qubo_batch(Qs, callback=log)
+        for k, ((_, energy), (_, replayed_energy)) in enumerate(zip(results, replayed)):
+            self.assertEqual(replayed_energy, energy)
+            self.assertEqual(log.energies(problem=k), [energy])
+        self.assertAlmostEqual(replayed[2][1], exhaustive_qubo(Qs[2]))